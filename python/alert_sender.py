@@ -4,13 +4,67 @@ Sends notifications for critical stock situations
 Reference: https://docs.snowflake.com/en/developer-guide/snowpark/python/working-with-dataframes
 """
 
+import io
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import List, Optional, Union
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from snowflake.snowpark import Session
-from snowflake.snowpark.functions import col
 from config import get_snowflake_session
-import argparse
+
+# Optional columns the console printer shows unformatted when present
+CONSOLE_ALERT_COLUMNS = ('ALERT_MESSAGE', 'CURRENT_STOCK')
+
+# Console icon per stock status
+_STATUS_ICON = {'OUT_OF_STOCK': "🔴", 'CRITICAL': "🟠", 'WARNING': "🟡"}
+
+# Last alert summary: (DataFrame, monotonic fetch time)
+_SUMMARY_CACHE = {}
+SUMMARY_CACHE_TTL_SECONDS = 60
+
+# STOCK_STATUS values that may be inlined into SQL text
+VALID_STATUSES = ('OUT_OF_STOCK', 'CRITICAL', 'WARNING')
+
+ALERT_SUMMARY_SQL = """
+    SELECT
+        alert_type,
+        COUNT(*) as count,
+        SUM(CASE WHEN acknowledged THEN 1 ELSE 0 END) as acknowledged_count,
+        SUM(CASE WHEN acknowledged THEN 0 ELSE 1 END) as pending_count
+    FROM alert_log
+    WHERE alert_date >= DATEADD(day, -7, CURRENT_DATE())
+    GROUP BY alert_type
+    ORDER BY count DESC
+"""
+
+
+def _arrow_string_dtype(arrow_type):
+    """Keep string columns Arrow-backed; numeric columns stay NumPy."""
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def _arrow_to_pandas(tbl: pa.Table) -> pd.DataFrame:
+    """Convert a query result to pandas, releasing the Arrow buffers as it goes."""
+    return tbl.to_pandas(types_mapper=_arrow_string_dtype, self_destruct=True)
+
+
+def _report_alert_count(alerts_tbl: pa.Table, statuses: Optional[List[str]] = None) -> bool:
+    """Print how many alerts a fetch returned; False when there are none."""
+    if alerts_tbl.num_rows == 0:
+        if statuses:
+            print(f"✅ No {', '.join(statuses)} alerts found.")
+        else:
+            print("✅ No critical alerts - all stock levels are healthy!")
+        return False
+    
+    print(f"⚠️ Found {alerts_tbl.num_rows} active alerts")
+    return True
 
 
 class AlertSender:
@@ -25,6 +79,7 @@ class AlertSender:
     
     def _load_config(self):
         """Load notification config from environment."""
+        # Imported here so importing this module stays cheap
         from dotenv import load_dotenv
         import os
         load_dotenv()
@@ -37,21 +92,69 @@ class AlertSender:
         
         print(f"📡 Alert Sender initialized with channels: {', '.join(self.alert_channels)}")
     
-    def fetch_critical_alerts(self):
+    def fetch_critical_alerts_table(self, statuses: Optional[List[str]] = None):
         """
-        Fetch all critical and warning alerts from Snowflake.
+        Fetch all critical and warning alerts as a PyArrow table.
+        Skips the pandas conversion for consumers that can work on Arrow directly.
+        When statuses is given, only those STOCK_STATUS values are fetched; the
+        filter runs in Snowflake so discarded rows never cross the wire.
         """
         print("🔍 Fetching critical alerts...")
         
         # Use uppercase column names to match Snowflake table exactly
-        alerts_df = self.session.table("critical_alerts").to_pandas()
+        alerts = self.session.table("critical_alerts")
+        if statuses:
+            from snowflake.snowpark.functions import col
+            alerts = alerts.filter(col("STOCK_STATUS").isin(statuses))
+        alerts_tbl = alerts.to_arrow()
         
-        if alerts_df.empty:
-            print("✅ No critical alerts - all stock levels are healthy!")
-            return None
+        return alerts_tbl if _report_alert_count(alerts_tbl, statuses) else None
+    
+    def fetch_critical_alerts(self, statuses: Optional[List[str]] = None):
+        """
+        Fetch all critical and warning alerts from Snowflake.
+        Optionally restricted to the given STOCK_STATUS values.
+        """
+        alerts_tbl = self.fetch_critical_alerts_table(statuses)
+        return _arrow_to_pandas(alerts_tbl) if alerts_tbl is not None else None
+    
+    def fetch_alerts_with_summary(self, statuses: Optional[List[str]] = None,
+                                  as_arrow: bool = False):
+        """
+        Fetch critical alerts and the 7-day alert summary in one round-trip.
+        Both queries are sent as a single multi-statement request.
+        With as_arrow=True the alerts are returned as a PyArrow table.
+        
+        Returns:
+            Tuple of (alerts DataFrame/Table or None, summary DataFrame)
+        """
+        print("🔍 Fetching critical alerts and summary...")
+        
+        alerts_sql = "SELECT * FROM critical_alerts"
+        if statuses:
+            # Multi-statement requests cannot bind parameters, so only known
+            # status literals are inlined
+            unknown = set(statuses) - set(VALID_STATUSES)
+            if unknown:
+                raise ValueError(f"Unknown stock status: {', '.join(sorted(unknown))}")
+            alerts_sql += " WHERE STOCK_STATUS IN ({})".format(
+                ", ".join(f"'{s}'" for s in statuses))
+        
+        cursor = self.session.connection.cursor()
+        try:
+            cursor.execute(f"{alerts_sql};\n{ALERT_SUMMARY_SQL}", num_statements=2)
+            alerts_tbl = cursor.fetch_arrow_all(force_return_table=True)
+            cursor.nextset()
+            summary_df = _arrow_to_pandas(cursor.fetch_arrow_all(force_return_table=True))
+        finally:
+            cursor.close()
+        
+        # Later get_alert_summary() calls within the TTL reuse this result
+        _SUMMARY_CACHE['summary'] = (summary_df, time.monotonic())
         
-        print(f"⚠️ Found {len(alerts_df)} active alerts")
-        return alerts_df
+        if not _report_alert_count(alerts_tbl, statuses):
+            return None, summary_df
+        return (alerts_tbl if as_arrow else _arrow_to_pandas(alerts_tbl)), summary_df
     
     def fetch_unacknowledged_alerts(self):
         """
@@ -59,7 +162,7 @@ class AlertSender:
         """
         print("🔍 Fetching unacknowledged alerts...")
         
-        alerts_df = self.session.sql("""
+        alerts_tbl = self.session.sql("""
             SELECT
                 alert_id,
                 location,
@@ -71,57 +174,82 @@ class AlertSender:
                 alert_date
             FROM alert_log
             WHERE acknowledged = FALSE
-            ORDER BY 
-                CASE alert_type
-                    WHEN 'OUT_OF_STOCK' THEN 1
-                    WHEN 'CRITICAL' THEN 2
-                    WHEN 'WARNING' THEN 3
-                    ELSE 4
-                END,
-                alert_date DESC
-        """).to_pandas()
+            ORDER BY alert_severity, alert_date DESC
+        """).to_arrow()
         
-        if alerts_df.empty:
+        if alerts_tbl.num_rows == 0:
             print("✅ No unacknowledged alerts")
             return None
         
-        print(f"📬 Found {len(alerts_df)} unacknowledged alerts")
-        return alerts_df
+        print(f"📬 Found {alerts_tbl.num_rows} unacknowledged alerts")
+        return _arrow_to_pandas(alerts_tbl)
     
-    def send_alerts(self, alerts_df: pd.DataFrame):
+    def send_alerts(self, alerts: Union[pd.DataFrame, pa.Table]):
         """
         Send alerts through configured channels.
+        Accepts a DataFrame or a PyArrow table.
         Filters for OUT_OF_STOCK and CRITICAL statuses for Email and Slack.
         """
-        if alerts_df is None or alerts_df.empty:
+        if alerts is None or len(alerts) == 0:
             return
         
-        # High priority items for external notifications
-        critical_mask = alerts_df['STOCK_STATUS'].isin(['OUT_OF_STOCK', 'CRITICAL', 'WARNING'])
-        critical_alerts = alerts_df[critical_mask]
-
-        print(f"\n📤 Processing {len(alerts_df)} alerts ({len(critical_alerts)} high priority)...")
+        if isinstance(alerts, pa.Table):
+            # Filter with Arrow's multithreaded kernels and convert only the
+            # high priority rows for the notifiers
+            critical = alerts.filter(pc.is_in(alerts['STOCK_STATUS'], value_set=pa.array(VALID_STATUSES)))
+            critical_alerts = _arrow_to_pandas(critical) if critical.num_rows else None
+            alerts_df = alerts.to_pandas(types_mapper=_arrow_string_dtype)
+        else:
+            alerts_df = alerts
+            # High priority items for external notifications
+            critical_mask = alerts_df['STOCK_STATUS'].isin(VALID_STATUSES)
+            critical_alerts = alerts_df[critical_mask] if critical_mask.any() else None
+        
+        critical_count = 0 if critical_alerts is None else len(critical_alerts)
+        print(f"\n📤 Processing {len(alerts_df)} alerts ({critical_count} high priority)...")
         
         # 1. Console Output (All alerts)
         if 'console' in self.alert_channels:
             self._send_console_alerts(alerts_df)
         
-        # 2. Email Notifications (Critical only)
-        if 'email' in self.alert_channels and not critical_alerts.empty:
-            try:
-                from email_notifier import EmailNotifier
-                EmailNotifier().send_alert_email(critical_alerts)
-            except Exception as e:
-                print(f"⚠️ Email notification failed: {e}")
+        if critical_alerts is not None:
+            self._dispatch_notifications(critical_alerts)
+    
+    def _dispatch_notifications(self, critical_alerts: pd.DataFrame):
+        """
+        Deliver critical alerts to Email and Slack concurrently.
+        Both channels are network-bound, so they run in parallel threads and a
+        failure in one channel does not cancel the other.
+        """
+        def send_email():
+            from email_notifier import EmailNotifier
+            # One SMTP connection for every email sent in the block
+            with EmailNotifier() as notifier:
+                notifier.send_many([critical_alerts])
         
-        # 3. Slack Notifications (Critical only)
-        if 'slack' in self.alert_channels and not critical_alerts.empty:
+        def send_slack():
+            from slack_notifier import SlackNotifier
+            SlackNotifier().send_alert_message(critical_alerts)
+        
+        # 2. Email / 3. Slack Notifications (Critical only)
+        tasks = []
+        if 'email' in self.alert_channels:
+            tasks.append(("Email", send_email))
+        if 'slack' in self.alert_channels:
+            tasks.append(("Slack", send_slack))
+        
+        if not tasks:
+            return
+        
+        def run(task):
+            name, send = task
             try:
-                from slack_notifier import SlackNotifier
-                SlackNotifier().send_alert_message(critical_alerts)
+                send()
             except Exception as e:
-                print(f"⚠️ Slack notification failed: {e}")
+                print(f"⚠️ {name} notification failed: {e}")
         
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            list(executor.map(run, tasks))
     
     def configure_channels(self, channels: list):
         """
@@ -139,88 +267,111 @@ class AlertSender:
         """
         Print alerts to console with color coding.
         """
-        print("\n" + "=" * 80)
-        print("🚨 STOCKPULSE 360 - CRITICAL ALERTS")
-        print("=" * 80)
-        
-        for idx, alert in alerts_df.iterrows():
-            # Standardize status key (View usually has STOCK_STATUS)
-            status = alert.get('STOCK_STATUS') or alert.get('ALERT_TYPE', 'UNKNOWN')
-            
-            # Color coding
-            if status == 'OUT_OF_STOCK':
-                icon = "🔴"
-            elif status == 'CRITICAL':
-                icon = "🟠"
-            elif status == 'WARNING':
-                icon = "🟡"
-            else:
-                icon = "ℹ️"
-            
-            print(f"\n{icon} Alert #{idx + 1}")
-            print(f"   Location: {alert.get('LOCATION', 'N/A')}")
-            print(f"   Item: {alert.get('ITEM', 'N/A')}")
-            print(f"   Status: {status}")
-            
-            if 'ALERT_MESSAGE' in alert:
-                print(f"   Message: {alert['ALERT_MESSAGE']}")
-            
-            # Use DAYS_UNTIL_STOCKOUT to match view schema
-            days_left = alert.get('DAYS_UNTIL_STOCKOUT') or alert.get('DAYS_LEFT')
-            if pd.notna(days_left):
-                print(f"   Days Until Stock-Out: {float(days_left):.1f}")
-            
-            if 'CURRENT_STOCK' in alert:
-                print(f"   Current Stock: {alert['CURRENT_STOCK']}")
-            
-            if 'AVG_DAILY_USAGE' in alert:
-                print(f"   Avg Daily Usage: {alert['AVG_DAILY_USAGE']:.2f}")
-            
-            # Use REORDER_QUANTITY to match view schema
-            reorder_qty = alert.get('REORDER_QUANTITY') or alert.get('RECOMMENDED_REORDER_QTY')
-            if pd.notna(reorder_qty):
-                print(f"   Recommended Reorder: {float(reorder_qty):.0f} units")
-        
-        print("\n" + "=" * 80)
+        # Pull the needed columns out once instead of boxing every row into a Series
+        available = set(alerts_df.columns)
+        # Optional columns printed as-is; tolist() keeps each value's own type
+        raw = {c: alerts_df[c].tolist() for c in CONSOLE_ALERT_COLUMNS if c in available}
+
+        def text(default, *names):
+            # First non-null string across the given columns, else default
+            series = None
+            for name in names:
+                if name in available:
+                    series = alerts_df[name] if series is None else series.fillna(alerts_df[name])
+            if series is None:
+                return [default] * len(alerts_df)
+            return series.fillna(default).to_numpy(dtype=object)
+
+        def formatted(fmt, *names):
+            # Format the first non-null value across the given columns in one
+            # vectorized pass; returns the strings and their notna mask
+            series = None
+            for name in names:
+                if name in available:
+                    series = alerts_df[name] if series is None else series.fillna(alerts_df[name])
+            if series is None:
+                return None, None
+            mask = series.notna()
+            return series.map(fmt.format, na_action='ignore').to_numpy(), mask.to_numpy()
+
+        # Use DAYS_UNTIL_STOCKOUT / REORDER_QUANTITY to match view schema
+        # Standardize status key (View usually has STOCK_STATUS)
+        status_arr = text('UNKNOWN', 'STOCK_STATUS', 'ALERT_TYPE')
+        location_arr = text('N/A', 'LOCATION')
+        item_arr = text('N/A', 'ITEM')
+        days_fmt, days_mask = formatted('{:.1f}', 'DAYS_UNTIL_STOCKOUT', 'DAYS_LEFT')
+        reorder_fmt, reorder_mask = formatted('{:.0f}', 'REORDER_QUANTITY', 'RECOMMENDED_REORDER_QTY')
+        usage_fmt, _ = formatted('{:.2f}', 'AVG_DAILY_USAGE')
+        message_arr = raw.get('ALERT_MESSAGE')
+        stock_arr = raw.get('CURRENT_STOCK')
+
+        # Build the whole report in memory and emit it with one write
+        buf = io.StringIO()
+        buf.write("\n" + "=" * 80 + "\n")
+        buf.write("🚨 STOCKPULSE 360 - CRITICAL ALERTS\n")
+        buf.write("=" * 80 + "\n")
+
+        for idx in range(len(alerts_df)):
+            status = status_arr[idx]
+            icon = _STATUS_ICON.get(status, "ℹ️")
+
+            buf.write(
+                f"\n{icon} Alert #{idx + 1}\n"
+                f"   Location: {location_arr[idx]}\n"
+                f"   Item: {item_arr[idx]}\n"
+                f"   Status: {status}\n"
+            )
+
+            if message_arr is not None:
+                buf.write(f"   Message: {message_arr[idx]}\n")
+
+            if days_mask is not None and days_mask[idx]:
+                buf.write(f"   Days Until Stock-Out: {days_fmt[idx]}\n")
+
+            if stock_arr is not None:
+                buf.write(f"   Current Stock: {stock_arr[idx]}\n")
+
+            if usage_fmt is not None:
+                buf.write(f"   Avg Daily Usage: {usage_fmt[idx]}\n")
+
+            if reorder_mask is not None and reorder_mask[idx]:
+                buf.write(f"   Recommended Reorder: {reorder_fmt[idx]} units\n")
+
+        buf.write("\n" + "=" * 80 + "\n")
+        sys.stdout.write(buf.getvalue())
+        sys.stdout.flush()
     
-    def acknowledge_alert(self, alert_id, acknowledged_by="System"):
+    def acknowledge_alert(self, alert_id: int, acknowledged_by: str = "System"):
         """
         Mark an alert as acknowledged.
         """
         try:
-            self.session.sql(f"""
+            self.session.sql("""
                 UPDATE alert_log
                 SET 
                     acknowledged = TRUE,
-                    acknowledged_by = '{acknowledged_by}',
+                    acknowledged_by = ?,
                     acknowledged_at = CURRENT_TIMESTAMP()
-                WHERE alert_id = {alert_id}
-            """).collect()
+                WHERE alert_id = ?
+            """, params=[acknowledged_by, alert_id]).collect()
             
             print(f"✅ Alert {alert_id} acknowledged by {acknowledged_by}")
             
         except Exception as e:
             print(f"❌ Error acknowledging alert: {e}")
     
-    def get_alert_summary(self):
+    def get_alert_summary(self, ttl_seconds: float = SUMMARY_CACHE_TTL_SECONDS):
         """
         Get summary statistics of alerts.
+        Calls within ttl_seconds of the last fetch return the cached summary.
         """
-        summary_df = self.session.sql("""
-            SELECT
-                alert_type,
-                COUNT(*) as count,
-                SUM(CASE WHEN acknowledged THEN 1 ELSE 0 END) as acknowledged_count,
-                SUM(CASE WHEN acknowledged THEN 0 ELSE 1 END) as pending_count
-            FROM alert_log
-            WHERE alert_date >= DATEADD(day, -7, CURRENT_DATE())
-            GROUP BY alert_type
-            ORDER BY count DESC
-        """).to_pandas()
+        cached = _SUMMARY_CACHE.get('summary')
+        if cached is not None and time.monotonic() - cached[1] < ttl_seconds:
+            return cached[0]
+        
+        summary_df = _arrow_to_pandas(self.session.sql(ALERT_SUMMARY_SQL).to_arrow())
+        _SUMMARY_CACHE['summary'] = (summary_df, time.monotonic())
         
-        return summary_df
-
-
         return summary_df
 
 
@@ -232,6 +383,8 @@ def run_alert_pipeline():
     - daily: Checks for CRITICAL/WARNING (run daily morning)
     - all: Checks everything (default)
     """
+    import argparse
+    
     parser = argparse.ArgumentParser(description='StockPulse 360 Alert Sender')
     parser.add_argument('--mode', choices=['immediate', 'daily', 'all'], default='all',
                         help='Alert mode: immediate (SOS only), daily (Morning Report), or all')
@@ -243,25 +396,23 @@ def run_alert_pipeline():
     print("=" * 60)
     
     try:
-        # Create session
+        # Reuse the process-wide session (closed automatically at exit)
         session = get_snowflake_session()
         
         # Initialize alert sender
         alert_sender = AlertSender(session)
         
-        # Fetch critical alerts
-        alerts = alert_sender.fetch_critical_alerts()
+        # Fetch critical alerts and the summary in one request
+        # (immediate mode only pulls OUT_OF_STOCK rows)
+        statuses = ['OUT_OF_STOCK'] if args.mode == 'immediate' else None
+        alerts, summary = alert_sender.fetch_alerts_with_summary(statuses=statuses, as_arrow=True)
         
         if alerts is not None:
             # Filter based on mode
             if args.mode == 'immediate':
                 # Only OUT_OF_STOCK
-                filtered_alerts = alerts[alerts['STOCK_STATUS'] == 'OUT_OF_STOCK']
-                if not filtered_alerts.empty:
-                    print(f"⚡ IMMEDIATE MODE: Sending {len(filtered_alerts)} OUT_OF_STOCK alerts")
-                    alert_sender.send_alerts(filtered_alerts)
-                else:
-                    print("✅ No OUT_OF_STOCK items found for immediate alert.")
+                print(f"⚡ IMMEDIATE MODE: Sending {len(alerts)} OUT_OF_STOCK alerts")
+                alert_sender.send_alerts(alerts)
                     
             elif args.mode == 'daily':
                 # Warnings and Critical (Morning Report)
@@ -276,12 +427,9 @@ def run_alert_pipeline():
             
             # Show summary (always useful)
             print("\n📊 Alert Summary (Last 7 Days):")
-            summary = alert_sender.get_alert_summary()
             if not summary.empty:
                 print(summary.to_string(index=False))
         
-        # Close session
-        session.close()
         print("\n✅ Alert pipeline completed successfully")
         
     except Exception as e:
@@ -3,12 +3,325 @@ StockPulse 360 - Anomaly Detection System
 Detects unusual patterns in stock usage and alerts on anomalies
 """
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from snowflake.snowpark import Session
-from snowflake.snowpark.functions import col, avg, stddev
 from datetime import datetime
-from config import get_snowflake_session
+from typing import TYPE_CHECKING
+from config import get_snowflake_session, fetch_pandas
+
+if TYPE_CHECKING:
+    from snowflake.snowpark import Session
+
+
+# All four report sections in one statement: the per-(location, item) window
+# aggregates are computed once over RAW_STOCK and each section's rows are
+# tagged with ISSUE_KIND. Columns a section does not use are NULL. Z-scores and
+# stock-out labels are added client-side (_score_usage / _label_stockouts).
+# Placeholders: the lowest Z-score threshold, then the change percentage twice.
+ANOMALY_REPORT_SQL = """
+WITH base AS (
+    SELECT
+        location,
+        item,
+        last_updated_date as record_date,
+        current_stock,
+        received_qty as received,
+        issued_qty as issued,
+        AVG(issued_qty) OVER (PARTITION BY location, item) as avg_usage,
+        STDDEV(issued_qty) OVER (PARTITION BY location, item) as stddev_usage,
+        LAG(current_stock) OVER (
+            PARTITION BY location, item ORDER BY last_updated_date
+        ) as prev_closing_stock,
+        LAG(issued_qty) OVER (
+            PARTITION BY location, item ORDER BY last_updated_date
+        ) as prev_issued
+    FROM RAW_STOCK
+),
+usage_anomalies AS (
+    SELECT
+        location, item, record_date, issued, avg_usage, stddev_usage
+    FROM base
+    WHERE stddev_usage > 0
+    AND ABS(issued - avg_usage) > (stddev_usage * ?)
+),
+sudden_changes AS (
+    SELECT
+        location, item, record_date,
+        current_stock as closing_stock, prev_closing_stock, issued, prev_issued,
+        CASE 
+            WHEN prev_closing_stock > 0 THEN
+                ((current_stock - prev_closing_stock) / prev_closing_stock) * 100
+            ELSE NULL
+        END as stock_change_pct,
+        CASE 
+            WHEN prev_issued > 0 THEN
+                ((issued - prev_issued) / prev_issued) * 100
+            ELSE NULL
+        END as usage_change_pct,
+        CASE
+            WHEN ABS(((current_stock - prev_closing_stock) / NULLIF(prev_closing_stock, 0)) * 100) > ?
+            THEN 'SUDDEN_STOCK_CHANGE'
+            WHEN ABS(((issued - prev_issued) / NULLIF(prev_issued, 0)) * 100) > ?
+            THEN 'SUDDEN_USAGE_CHANGE'
+            ELSE 'NORMAL'
+        END as change_type
+    FROM base
+    WHERE prev_closing_stock IS NOT NULL
+    AND change_type != 'NORMAL'
+),
+quality_issues AS (
+    SELECT
+        location, item, record_date, current_stock, received, issued,
+        CASE
+            WHEN current_stock < 0 THEN 'NEGATIVE_STOCK'
+            WHEN received < 0 THEN 'NEGATIVE_RECEIVED'
+            WHEN issued < 0 THEN 'NEGATIVE_ISSUED'
+            WHEN issued > current_stock THEN 'OVER_ISSUED'
+            ELSE 'OK'
+        END as quality_issue,
+        0 as discrepancy
+    FROM base
+    WHERE quality_issue != 'OK'
+),
+stockout_patterns AS (
+    SELECT
+        location,
+        item,
+        COUNT(*) as total_days,
+        SUM(CASE WHEN current_stock <= 0 THEN 1 ELSE 0 END) as stockout_days,
+        MAX(CASE WHEN current_stock <= 0 THEN record_date END) as last_stockout_date
+    FROM base
+    GROUP BY location, item
+    HAVING stockout_days > 0
+)
+SELECT 'usage_anomalies' as issue_kind, location, item, record_date, issued, avg_usage, stddev_usage,
+       NULL as closing_stock, NULL as prev_closing_stock, NULL as prev_issued,
+       NULL as stock_change_pct, NULL as usage_change_pct, NULL as change_type,
+       NULL as current_stock, NULL as received, NULL as quality_issue, NULL as discrepancy,
+       NULL as total_days, NULL as stockout_days, NULL as last_stockout_date
+FROM usage_anomalies
+UNION ALL
+SELECT 'sudden_changes', location, item, record_date, issued, NULL, NULL,
+       closing_stock, prev_closing_stock, prev_issued,
+       stock_change_pct, usage_change_pct, change_type,
+       NULL, NULL, NULL, NULL,
+       NULL, NULL, NULL
+FROM sudden_changes
+UNION ALL
+SELECT 'data_quality_issues', location, item, record_date, issued, NULL, NULL,
+       NULL, NULL, NULL,
+       NULL, NULL, NULL,
+       current_stock, received, quality_issue, discrepancy,
+       NULL, NULL, NULL
+FROM quality_issues
+UNION ALL
+SELECT 'stockout_patterns', location, item, NULL, NULL, NULL, NULL,
+       NULL, NULL, NULL,
+       NULL, NULL, NULL,
+       NULL, NULL, NULL, NULL,
+       total_days, stockout_days, last_stockout_date
+FROM stockout_patterns
+"""
+
+# Report section -> (columns in detector order, sort column, sort by absolute value)
+ANOMALY_REPORT_SECTIONS = {
+    'usage_anomalies': (
+        ['LOCATION', 'ITEM', 'RECORD_DATE', 'ISSUED', 'AVG_USAGE', 'STDDEV_USAGE',
+         'Z_SCORE', 'ANOMALY_STATUS'],
+        'Z_SCORE', False),
+    'sudden_changes': (
+        ['LOCATION', 'ITEM', 'RECORD_DATE', 'CLOSING_STOCK', 'PREV_CLOSING_STOCK',
+         'ISSUED', 'PREV_ISSUED', 'STOCK_CHANGE_PCT', 'USAGE_CHANGE_PCT', 'CHANGE_TYPE'],
+        'STOCK_CHANGE_PCT', True),
+    'data_quality_issues': (
+        ['LOCATION', 'ITEM', 'RECORD_DATE', 'CURRENT_STOCK', 'RECEIVED', 'ISSUED',
+         'QUALITY_ISSUE', 'DISCREPANCY'],
+        'RECORD_DATE', False),
+    'stockout_patterns': (
+        ['LOCATION', 'ITEM', 'TOTAL_DAYS', 'STOCKOUT_DAYS', 'STOCKOUT_RATE_PCT',
+         'LAST_STOCKOUT_DATE', 'PATTERN_TYPE'],
+        'STOCKOUT_RATE_PCT', False),
+}
+
+# Per-(location, item) usage statistics, computed inline or read from the MV
+USAGE_STATS_SQL = """
+SELECT
+    location,
+    item,
+    AVG(issued_qty) as avg_usage,
+    STDDEV(issued_qty) as stddev_usage
+FROM RAW_STOCK
+GROUP BY location, item
+HAVING stddev_usage > 0
+"""
+
+USAGE_STATS_MV_SQL = """
+SELECT location, item, avg_usage, stddev_usage
+FROM usage_stats_mv
+WHERE stddev_usage > 0
+"""
+
+# Raw rows shared by the client-side detectors (see AnomalyDetector._raw_stock)
+RAW_STOCK_SQL = """
+SELECT
+    location,
+    item,
+    last_updated_date as record_date,
+    issued_qty as issued,
+    current_stock
+FROM RAW_STOCK
+"""
+
+STOCKOUT_SUMMARY_MV_SQL = """
+SELECT location, item, total_days, stockout_days, last_stockout_date
+FROM stockout_summary_mv
+WHERE stockout_days > 0
+"""
+
+# Day-over-day changes; both placeholders take the threshold percentage
+SUDDEN_CHANGES_SQL = """
+WITH daily_changes AS (
+    SELECT
+        location,
+        item,
+        last_updated_date as record_date,
+        current_stock as closing_stock,
+        LAG(current_stock) OVER (
+            PARTITION BY location, item
+            ORDER BY last_updated_date
+        ) as prev_closing_stock,
+        issued_qty as issued,
+        LAG(issued_qty) OVER (
+            PARTITION BY location, item
+            ORDER BY last_updated_date
+        ) as prev_issued
+    FROM RAW_STOCK
+)
+SELECT
+    location,
+    item,
+    record_date,
+    closing_stock,
+    prev_closing_stock,
+    issued,
+    prev_issued,
+    CASE 
+        WHEN prev_closing_stock > 0 THEN
+            ((closing_stock - prev_closing_stock) / prev_closing_stock) * 100
+        ELSE NULL
+    END as stock_change_pct,
+    CASE 
+        WHEN prev_issued > 0 THEN
+            ((issued - prev_issued) / prev_issued) * 100
+        ELSE NULL
+    END as usage_change_pct,
+    CASE
+        WHEN ABS(((closing_stock - prev_closing_stock) / NULLIF(prev_closing_stock, 0)) * 100) > ?
+        THEN 'SUDDEN_STOCK_CHANGE'
+        WHEN ABS(((issued - prev_issued) / NULLIF(prev_issued, 0)) * 100) > ?
+        THEN 'SUDDEN_USAGE_CHANGE'
+        ELSE 'NORMAL'
+    END as change_type
+FROM daily_changes
+WHERE prev_closing_stock IS NOT NULL
+AND change_type != 'NORMAL'
+"""
+
+# Template for detectors that find nothing (see _empty_result)
+_EMPTY_DF = pd.DataFrame()
+
+
+def _empty_result() -> pd.DataFrame:
+    """Empty detector result; a shallow copy so callers cannot modify the shared frame."""
+    return _EMPTY_DF.copy(deep=False)
+
+
+# Low-cardinality label columns stored as pandas categoricals in detector results
+_CATEGORICAL_COLS = ('LOCATION', 'ITEM', 'ANOMALY_STATUS', 'CHANGE_TYPE', 'QUALITY_ISSUE', 'PATTERN_TYPE')
+
+
+def _categorize(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the label columns present in df to the category dtype."""
+    return df.astype({c: 'category' for c in _CATEGORICAL_COLS if c in df.columns})
+
+
+def _count_combinations(df: pd.DataFrame, columns) -> pd.Series:
+    """
+    Count rows per combination of categorical columns, most frequent first.
+    The category codes are packed into one integer key per row and counted
+    with np.unique, so only combinations that occur are returned. Rows with a
+    missing label (code -1) are skipped, as value_counts() would.
+    """
+    cats = [df[c].cat for c in columns]
+    shape = tuple(len(cat.categories) for cat in cats)
+    codes = np.vstack([cat.codes.to_numpy() for cat in cats])
+    codes = codes[:, (codes >= 0).all(axis=0)]
+    keys = np.ravel_multi_index(tuple(codes), shape)
+    
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    codes = np.unravel_index(unique_keys, shape)
+    index = pd.MultiIndex.from_arrays(
+        [cat.categories[code] for cat, code in zip(cats, codes)], names=columns
+    )
+    return pd.Series(counts, index=index).sort_values(ascending=False, kind='stable')
+
+
+# Z-score bands: <= 2.0 NORMAL, (2.0, 2.5] WARNING, > 2.5 ANOMALY
+Z_SCORE_THRESHOLDS = np.array([2.0, 2.5])
+Z_SCORE_LABELS = np.array(['NORMAL', 'WARNING', 'ANOMALY'])
+
+# Stock-out rate (%) bands: 0 NONE, (0, 10] RARE, (10, 20] OCCASIONAL, > 20 FREQUENT
+STOCKOUT_RATE_THRESHOLDS = np.array([0.0, 10.0, 20.0])
+STOCKOUT_RATE_LABELS = np.array(['NO_STOCKOUTS', 'RARE_STOCKOUTS', 'OCCASIONAL_STOCKOUTS', 'FREQUENT_STOCKOUTS'])
+
+
+def _label(values: np.ndarray, thresholds: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    Map each value to labels[i], where i is the number of thresholds strictly
+    below it; one binary search per value instead of chained np.where passes.
+    """
+    return labels[np.searchsorted(thresholds, values, side='left')]
+
+
+def _score_usage(df: pd.DataFrame) -> pd.DataFrame:
+    """Add Z_SCORE and ANOMALY_STATUS to rows carrying ISSUED / AVG_USAGE / STDDEV_USAGE."""
+    issued = df['ISSUED'].to_numpy(dtype=np.float64)
+    avg_usage = df['AVG_USAGE'].to_numpy(dtype=np.float64)
+    stddev_usage = df['STDDEV_USAGE'].to_numpy(dtype=np.float64)
+    z_score = np.abs(issued - avg_usage) / stddev_usage
+    return df.assign(
+        Z_SCORE=z_score,
+        ANOMALY_STATUS=_label(z_score, Z_SCORE_THRESHOLDS, Z_SCORE_LABELS),
+    )
+
+
+def _label_stockouts(stats: pd.DataFrame) -> pd.DataFrame:
+    """Add STOCKOUT_RATE_PCT and PATTERN_TYPE to per-item TOTAL_DAYS / STOCKOUT_DAYS counts."""
+    rate = stats['STOCKOUT_DAYS'].to_numpy(dtype=np.float64) * 100.0 / stats['TOTAL_DAYS'].to_numpy(dtype=np.float64)
+    return stats.assign(
+        STOCKOUT_RATE_PCT=np.round(rate, 2),
+        PATTERN_TYPE=_label(rate, STOCKOUT_RATE_THRESHOLDS, STOCKOUT_RATE_LABELS),
+    )
+
+
+def _order_section(df: pd.DataFrame, kind: str) -> pd.DataFrame:
+    """
+    Sort a detector result client-side, after filtering, in the order its
+    query used to request from Snowflake (NULLs first on DESC, like Snowflake).
+    """
+    _, sort_col, by_abs = ANOMALY_REPORT_SECTIONS[kind]
+    return df.sort_values(
+        sort_col, ascending=False, na_position='first',
+        key=(lambda s: s.abs()) if by_abs else None
+    ).reset_index(drop=True)
+
+
+# Detector columns used for anomaly_log's date and severity, in priority order
+ANOMALY_DATE_COLUMNS = ('RECORD_DATE', 'LAST_STOCKOUT_DATE')
+ANOMALY_SEVERITY_COLUMNS = ('ANOMALY_STATUS', 'CHANGE_TYPE', 'QUALITY_ISSUE', 'PATTERN_TYPE')
 
 
 class AnomalyDetector:
@@ -17,66 +330,97 @@ class AnomalyDetector:
     Identifies unusual spikes, drops, and data quality issues.
     """
     
-    def __init__(self, session: Session):
+    def __init__(self, session: 'Session', use_materialized_views: bool = False):
         self.session = session
         self.sensitivity = 2.5  # Standard deviations for anomaly threshold
+        self.use_materialized_views = False  # Set by setup_materialized_views()
+        self._raw_stock_df = None
+        self._raw_stock_lock = threading.Lock()
+        
+        if use_materialized_views:
+            self.setup_materialized_views()
+    
+    def setup_materialized_views(self):
+        """
+        Create materialized views holding the per-(location, item) aggregates
+        the detectors need, so they are maintained incrementally by Snowflake
+        instead of recomputed from RAW_STOCK on every run.
+        
+        The views cost extra storage (one row per location/item pair) and
+        background maintenance credits, and require Enterprise Edition. If
+        they cannot be created the detectors keep computing inline.
+        """
+        try:
+            self.session.sql("""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS usage_stats_mv AS
+                SELECT
+                    location,
+                    item,
+                    AVG(issued_qty) as avg_usage,
+                    STDDEV(issued_qty) as stddev_usage
+                FROM RAW_STOCK
+                GROUP BY location, item
+            """).collect()
+            
+            self.session.sql("""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS stockout_summary_mv AS
+                SELECT
+                    location,
+                    item,
+                    COUNT(*) as total_days,
+                    SUM(CASE WHEN current_stock <= 0 THEN 1 ELSE 0 END) as stockout_days,
+                    MAX(CASE WHEN current_stock <= 0 THEN last_updated_date END) as last_stockout_date
+                FROM RAW_STOCK
+                GROUP BY location, item
+            """).collect()
+            
+            self.use_materialized_views = True
+            print("✅ Materialized views ready: usage_stats_mv, stockout_summary_mv")
+        except Exception as e:
+            self.use_materialized_views = False
+            print(f"⚠️ Materialized views unavailable, computing aggregates inline: {e}")
+        
+        return self.use_materialized_views
+    
+    def _fetch_df(self, sql: str, params=None) -> pd.DataFrame:
+        """Fetch a query result as pandas via the connector's Arrow batches."""
+        return fetch_pandas(self.session, sql, params)
+    
+    def _raw_stock(self) -> pd.DataFrame:
+        """RAW_STOCK rows used by the client-side detectors, fetched once per detector."""
+        # Locked so detectors running concurrently share a single fetch
+        with self._raw_stock_lock:
+            if self._raw_stock_df is None:
+                self._raw_stock_df = self._fetch_df(RAW_STOCK_SQL)
+        return self._raw_stock_df
     
     def detect_usage_anomalies(self):
         """
         Detect anomalies in daily usage patterns.
         Uses Z-score method to identify outliers.
+        Only the raw usage rows and one stats row per (location, item) are
+        fetched; Z-scores and labels are computed client-side with NumPy.
         """
         print("🔍 Detecting usage anomalies...")
         
         # Get usage statistics
-        anomaly_query = """
-        WITH usage_stats AS (
-            SELECT
-                location,
-                item,
-                last_updated_date as record_date,
-                issued_qty as issued,
-                AVG(issued_qty) OVER (
-                    PARTITION BY location, item
-                ) as avg_usage,
-                STDDEV(issued_qty) OVER (
-                    PARTITION BY location, item
-                ) as stddev_usage
-            FROM RAW_STOCK
+        stats_df = self._fetch_df(
+            USAGE_STATS_MV_SQL if self.use_materialized_views else USAGE_STATS_SQL
         )
-        SELECT
-            location,
-            item,
-            record_date,
-            issued,
-            avg_usage,
-            stddev_usage,
-            CASE 
-                WHEN stddev_usage > 0 THEN
-                    ABS(issued - avg_usage) / stddev_usage
-                ELSE 0
-            END as z_score,
-            CASE
-                WHEN ABS(issued - avg_usage) > (stddev_usage * 2.5) THEN 'ANOMALY'
-                WHEN ABS(issued - avg_usage) > (stddev_usage * 2.0) THEN 'WARNING'
-                ELSE 'NORMAL'
-            END as anomaly_status
-        FROM usage_stats
-        WHERE stddev_usage > 0
-        ORDER BY z_score DESC
-        """
+        raw_df = self._raw_stock()[['LOCATION', 'ITEM', 'RECORD_DATE', 'ISSUED']]
         
-        results = self.session.sql(anomaly_query).to_pandas()
+        # Inner join drops items with no variation (stddev 0 / NULL)
+        results = _score_usage(raw_df.merge(stats_df, on=['LOCATION', 'ITEM']))
         
         # Filter anomalies
-        anomalies = results[results['ANOMALY_STATUS'].isin(['ANOMALY', 'WARNING'])]
+        anomalies = results[results['Z_SCORE'].to_numpy() > Z_SCORE_THRESHOLDS[0]]
         
         if not anomalies.empty:
             print(f"⚠️ Found {len(anomalies)} anomalies")
-            return anomalies
+            return _categorize(_order_section(anomalies, 'usage_anomalies'))
         else:
             print("✅ No anomalies detected")
-            return pd.DataFrame()
+            return _empty_result()
     
     def detect_sudden_changes(self, threshold_percent: float = 50.0):
         """
@@ -87,63 +431,14 @@ class AnomalyDetector:
         """
         print(f"📉 Detecting sudden changes (>{threshold_percent}%)...")
         
-        change_query = f"""
-        WITH daily_changes AS (
-            SELECT
-                location,
-                item,
-                last_updated_date as record_date,
-                current_stock as closing_stock,
-                LAG(current_stock) OVER (
-                    PARTITION BY location, item
-                    ORDER BY last_updated_date
-                ) as prev_closing_stock,
-                issued_qty as issued,
-                LAG(issued_qty) OVER (
-                    PARTITION BY location, item
-                    ORDER BY last_updated_date
-                ) as prev_issued
-            FROM RAW_STOCK
-        )
-        SELECT
-            location,
-            item,
-            record_date,
-            closing_stock,
-            prev_closing_stock,
-            issued,
-            prev_issued,
-            CASE 
-                WHEN prev_closing_stock > 0 THEN
-                    ((closing_stock - prev_closing_stock) / prev_closing_stock) * 100
-                ELSE NULL
-            END as stock_change_pct,
-            CASE 
-                WHEN prev_issued > 0 THEN
-                    ((issued - prev_issued) / prev_issued) * 100
-                ELSE NULL
-            END as usage_change_pct,
-            CASE
-                WHEN ABS(((closing_stock - prev_closing_stock) / NULLIF(prev_closing_stock, 0)) * 100) > {threshold_percent}
-                THEN 'SUDDEN_STOCK_CHANGE'
-                WHEN ABS(((issued - prev_issued) / NULLIF(prev_issued, 0)) * 100) > {threshold_percent}
-                THEN 'SUDDEN_USAGE_CHANGE'
-                ELSE 'NORMAL'
-            END as change_type
-        FROM daily_changes
-        WHERE prev_closing_stock IS NOT NULL
-        AND change_type != 'NORMAL'
-        ORDER BY ABS(stock_change_pct) DESC
-        """
-        
-        results = self.session.sql(change_query).to_pandas()
+        results = self._fetch_df(SUDDEN_CHANGES_SQL, [threshold_percent, threshold_percent])
         
         if not results.empty:
             print(f"⚠️ Found {len(results)} sudden changes")
-            return results
+            return _categorize(_order_section(results, 'sudden_changes'))
         else:
             print("✅ No sudden changes detected")
-            return pd.DataFrame()
+            return _empty_result()
     
     def detect_data_quality_issues(self):
         """
@@ -170,77 +465,79 @@ class AnomalyDetector:
             0 as discrepancy
         FROM RAW_STOCK
         WHERE quality_issue != 'OK'
-        ORDER BY record_date DESC
         """
         
-        results = self.session.sql(quality_query).to_pandas()
+        results = self._fetch_df(quality_query)
         
         if not results.empty:
             print(f"⚠️ Found {len(results)} data quality issues")
-            return results
+            return _categorize(_order_section(results, 'data_quality_issues'))
         else:
             print("✅ No data quality issues detected")
-            return pd.DataFrame()
+            return _empty_result()
     
     def detect_stockout_patterns(self):
         """
         Detect patterns that lead to stock-outs.
         Identifies items that frequently run out.
+        Per-item counts come from stockout_summary_mv when available, else from
+        one groupby over the shared raw stock frame; rates and labels are
+        computed client-side.
         """
         print("📊 Analyzing stock-out patterns...")
         
-        pattern_query = """
-        WITH stockout_history AS (
-            SELECT
-                location,
-                item,
-                last_updated_date as record_date,
-                current_stock,
-                CASE WHEN current_stock <= 0 THEN 1 ELSE 0 END as is_stockout
-            FROM RAW_STOCK
-        )
-        SELECT
-            location,
-            item,
-            COUNT(*) as total_days,
-            SUM(is_stockout) as stockout_days,
-            ROUND((SUM(is_stockout) * 100.0 / COUNT(*)), 2) as stockout_rate_pct,
-            MAX(CASE WHEN is_stockout = 1 THEN record_date END) as last_stockout_date,
-            CASE
-                WHEN (SUM(is_stockout) * 100.0 / COUNT(*)) > 20 THEN 'FREQUENT_STOCKOUTS'
-                WHEN (SUM(is_stockout) * 100.0 / COUNT(*)) > 10 THEN 'OCCASIONAL_STOCKOUTS'
-                WHEN SUM(is_stockout) > 0 THEN 'RARE_STOCKOUTS'
-                ELSE 'NO_STOCKOUTS'
-            END as pattern_type
-        FROM stockout_history
-        GROUP BY location, item
-        HAVING SUM(is_stockout) > 0
-        ORDER BY stockout_rate_pct DESC
-        """
-        
-        results = self.session.sql(pattern_query).to_pandas()
-        
-        if not results.empty:
-            print(f"📈 Found {len(results)} items with stock-out patterns")
-            return results
+        if self.use_materialized_views:
+            stats = self._fetch_df(STOCKOUT_SUMMARY_MV_SQL)
         else:
+            raw = self._raw_stock()
+            is_stockout = (raw['CURRENT_STOCK'].to_numpy(dtype=np.float64) <= 0).astype(np.int8)
+            stats = (
+                raw[['LOCATION', 'ITEM']]
+                .assign(
+                    IS_STOCKOUT=is_stockout,
+                    # Dates arrive as object datetime.date; max() needs datetime64
+                    STOCKOUT_DATE=pd.to_datetime(raw['RECORD_DATE']).where(is_stockout.astype(bool)),
+                )
+                .groupby(['LOCATION', 'ITEM'], sort=False, observed=True)
+                .agg(
+                    TOTAL_DAYS=('IS_STOCKOUT', 'size'),
+                    STOCKOUT_DAYS=('IS_STOCKOUT', 'sum'),
+                    LAST_STOCKOUT_DATE=('STOCKOUT_DATE', 'max'),
+                )
+                .reset_index()
+            )
+            stats = stats[stats['STOCKOUT_DAYS'].to_numpy() > 0]
+        
+        if stats.empty:
             print("✅ No stock-out patterns detected")
-            return pd.DataFrame()
+            return _empty_result()
+        
+        results = _label_stockouts(stats)[ANOMALY_REPORT_SECTIONS['stockout_patterns'][0]]
+        
+        print(f"📈 Found {len(results)} items with stock-out patterns")
+        return _categorize(_order_section(results, 'stockout_patterns'))
     
-    def generate_anomaly_report(self):
+    def generate_anomaly_report(self, threshold_percent: float = 50.0):
         """
         Generate comprehensive anomaly report.
+        Runs all four detectors as a single query (see ANOMALY_REPORT_SQL) and
+        splits the tagged result back into one DataFrame per section. If the
+        fused query fails, the individual detectors run concurrently instead.
+        With materialized views set up, the detectors read their aggregates
+        from the views and run concurrently rather than rescanning RAW_STOCK.
         """
         print("\n" + "=" * 60)
         print("ANOMALY DETECTION REPORT")
         print("=" * 60)
         
-        report = {
-            'usage_anomalies': self.detect_usage_anomalies(),
-            'sudden_changes': self.detect_sudden_changes(),
-            'data_quality_issues': self.detect_data_quality_issues(),
-            'stockout_patterns': self.detect_stockout_patterns()
-        }
+        if self.use_materialized_views:
+            report = self._concurrent_report(threshold_percent)
+        else:
+            try:
+                report = self._fused_report(threshold_percent)
+            except Exception as e:
+                print(f"⚠️ Combined anomaly query failed, running detectors separately: {e}")
+                report = self._concurrent_report(threshold_percent)
         
         # Summary
         print("\n📊 SUMMARY:")
@@ -251,6 +548,46 @@ class AnomalyDetector:
         
         return report
     
+    def _fused_report(self, threshold_percent: float):
+        """Run ANOMALY_REPORT_SQL and split it into one DataFrame per section."""
+        print("🔍 Scanning stock history for anomalies...")
+        results = self._fetch_df(
+            ANOMALY_REPORT_SQL,
+            [float(Z_SCORE_THRESHOLDS[0]), threshold_percent, threshold_percent]
+        )
+        sections = dict(tuple(results.groupby('ISSUE_KIND', sort=False)))
+        # Scores and labels come from the same helpers as the standalone detectors
+        for kind, label in (('usage_anomalies', _score_usage), ('stockout_patterns', _label_stockouts)):
+            if kind in sections:
+                sections[kind] = label(sections[kind])
+        
+        report = {}
+        for kind, (columns, _, _) in ANOMALY_REPORT_SECTIONS.items():
+            section = sections.get(kind)
+            if section is None:
+                report[kind] = _empty_result()
+                continue
+            # Same ordering as the standalone detector
+            report[kind] = _categorize(_order_section(section[columns], kind))
+        
+        return report
+    
+    def _concurrent_report(self, threshold_percent: float):
+        """
+        Run the four detectors on a thread pool. Each is an independent
+        Snowflake round trip, so the report takes as long as the slowest one.
+        """
+        detectors = {
+            'usage_anomalies': self.detect_usage_anomalies,
+            'sudden_changes': lambda: self.detect_sudden_changes(threshold_percent),
+            'data_quality_issues': self.detect_data_quality_issues,
+            'stockout_patterns': self.detect_stockout_patterns,
+        }
+        
+        with ThreadPoolExecutor(max_workers=len(detectors)) as executor:
+            futures = {kind: executor.submit(detect) for kind, detect in detectors.items()}
+            return {kind: future.result() for kind, future in futures.items()}
+    
     def save_anomalies_to_table(self, anomalies_df: pd.DataFrame, anomaly_type: str):
         """
         Save detected anomalies to Snowflake table.
@@ -271,12 +608,29 @@ class AnomalyDetector:
             
             # Prepare data for insertion
             if not anomalies_df.empty:
-                anomalies_df['anomaly_type'] = anomaly_type
-                anomalies_df['detected_at'] = datetime.now()
+                date_col = next((c for c in ANOMALY_DATE_COLUMNS if c in anomalies_df.columns), None)
+                severity_col = next((c for c in ANOMALY_SEVERITY_COLUMNS if c in anomalies_df.columns), None)
                 
-                # Insert anomalies
-                # Note: Simplified - in production, map columns properly
-                print(f"✅ Logged {len(anomalies_df)} {anomaly_type} anomalies")
+                # Map the detector's columns onto anomaly_log without touching the caller's frame
+                log_df = anomalies_df[['LOCATION', 'ITEM']].assign(
+                    ANOMALY_DATE=pd.to_datetime(anomalies_df[date_col]).dt.date if date_col else None,
+                    ANOMALY_TYPE=anomaly_type,
+                    SEVERITY=anomalies_df[severity_col] if severity_col else None,
+                    DESCRIPTION=f"{anomaly_type} detected by StockPulse anomaly scan",
+                    DETECTED_AT=pd.Timestamp(datetime.now()),
+                )
+                
+                # Insert anomalies: one Parquet upload + COPY INTO instead of row inserts
+                self.session.write_pandas(
+                    log_df,
+                    "ANOMALY_LOG",
+                    auto_create_table=False,
+                    chunk_size=100_000,
+                    parallel=8,
+                    compression="snappy",
+                    use_logical_type=True
+                )
+                print(f"✅ Logged {len(log_df)} {anomaly_type} anomalies")
             
         except Exception as e:
             print(f"⚠️ Error saving anomalies: {e}")
@@ -292,7 +646,9 @@ def run_anomaly_detection():
     
     try:
         session = get_snowflake_session()
-        detector = AnomalyDetector(session)
+        # Opt-in: the views need Enterprise Edition and add maintenance credits
+        use_mvs = os.getenv("ANOMALY_MATERIALIZED_VIEWS", "false").lower() == "true"
+        detector = AnomalyDetector(session, use_materialized_views=use_mvs)
         
         # Generate comprehensive report
         report = detector.generate_anomaly_report()
@@ -300,13 +656,12 @@ def run_anomaly_detection():
         # Display details if anomalies found
         if not report['usage_anomalies'].empty:
             print("\n⚠️ TOP USAGE ANOMALIES:")
-            print(report['usage_anomalies'].head(5)[['LOCATION', 'ITEM', 'ISSUED', 'AVG_USAGE', 'Z_SCORE']])
+            print(report['usage_anomalies'].nlargest(5, 'Z_SCORE')[['LOCATION', 'ITEM', 'ISSUED', 'AVG_USAGE', 'Z_SCORE']])
         
         if not report['data_quality_issues'].empty:
             print("\n⚠️ DATA QUALITY ISSUES:")
-            print(report['data_quality_issues'][['LOCATION', 'ITEM', 'QUALITY_ISSUE']].value_counts())
+            print(_count_combinations(report['data_quality_issues'], ['LOCATION', 'ITEM', 'QUALITY_ISSUE']))
         
-        session.close()
         print("\n✅ Anomaly detection completed")
         
     except Exception as e:
@@ -13,17 +13,15 @@ result = session.sql("SHOW TABLES").collect()
 
 print("Available Tables:")
 print("-" * 60)
-for row in result:
-    row_count = row['rows'] if 'rows' in row.asDict() else 'N/A'
-    print(f"  - {row['name']} (rows: {row_count})")
+rows_by_name = {row['name']: row for row in result}
+for name, row in rows_by_name.items():
+    print(f"  - {name} (rows: {getattr(row, 'rows', 'N/A')})")
 
 # Check if STOCK_RAW exists
-stock_raw_exists = any(row['name'] == 'STOCK_RAW' for row in result)
-raw_stock_exists = any(row['name'] == 'RAW_STOCK' for row in result)
+stock_raw_exists = 'STOCK_RAW' in rows_by_name
+raw_stock_exists = 'RAW_STOCK' in rows_by_name
 
 print("\n" + "=" * 60)
 print(f"STOCK_RAW exists: {stock_raw_exists}")
 print(f"RAW_STOCK exists: {raw_stock_exists}")
 print("=" * 60)
-
-session.close()
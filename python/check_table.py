@@ -13,11 +13,11 @@ result = session.sql("DESC TABLE RAW_STOCK").collect()
 
 print("Column Name | Type | Nullable")
 print("-" * 50)
+columns = []
 for row in result:
-    print(f"{row['name']} | {row['type']} | {row['null?']}")
+    name = row['name']
+    columns.append(name)
+    print(f"{name} | {row['type']} | {row['null?']}")
 
 print("\n📋 Column names list:")
-columns = [row['name'] for row in result]
 print(columns)
-
-session.close()
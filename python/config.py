@@ -3,10 +3,25 @@ StockPulse 360 - Snowflake Configuration
 Reference: https://docs.snowflake.com/en/developer-guide/python-connector/python-connector-connect
 """
 
+import atexit
 import os
+import tempfile
+import threading
+import uuid
+from functools import lru_cache
 from typing import Dict
 from dotenv import load_dotenv
 
+__all__ = [
+    "SNOWFLAKE_CONFIG",
+    "APP_CONFIG",
+    "get_config_value",
+    "get_snowflake_session",
+    "get_snowflake_connector",
+    "fetch_pandas",
+    "copy_via_parquet",
+]
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -16,29 +31,34 @@ load_dotenv()
 # IMPORTANT: Replace these with your actual Snowflake credentials
 # For production, use environment variables or Snowflake config file
 
-# Helper to get config from multiple sources
-def get_config_value(key, env_key):
-    # 1. Try Streamlit Secrets (for Cloud)
+# Fallbacks for settings that have a safe default (don't use placeholders
+# for credentials - those stay None when missing)
+_CONFIG_DEFAULTS = {
+    "role": "ACCOUNTADMIN",
+    "schema": "PUBLIC",
+    "warehouse": "COMPUTE_WH",
+}
+
+@lru_cache(maxsize=1)
+def _secrets() -> Dict[str, str]:
+    """Read the Streamlit Snowflake secrets once (for Cloud); empty when unavailable."""
     try:
         import streamlit as st
         # Check nested [connections.snowflake] first
         if "connections" in st.secrets and "snowflake" in st.secrets["connections"]:
-            return st.secrets["connections"]["snowflake"].get(key)
+            return dict(st.secrets["connections"]["snowflake"])
         # Check flat [snowflake] (alternative)
         if "snowflake" in st.secrets:
-            return st.secrets["snowflake"].get(key)
-    except:
+            return dict(st.secrets["snowflake"])
+    except Exception:
         pass
-        
-    # 2. Try Environment Variable (for Local)
-    val = os.getenv(env_key)
-    if val: return val
-    
-    # 3. Fail hard if missing (don't use placeholders)
-    if key == "role": return "ACCOUNTADMIN" # Safe default
-    if key == "schema": return "PUBLIC"
-    if key == "warehouse": return "COMPUTE_WH"
-    return None
+    return {}
+
+# Helper to get config from multiple sources
+def get_config_value(key, env_key):
+    # 1. Streamlit Secrets (for Cloud), 2. Environment Variable (for Local),
+    # 3. Safe default if one exists
+    return _secrets().get(key) or os.getenv(env_key) or _CONFIG_DEFAULTS.get(key)
 
 SNOWFLAKE_CONFIG: Dict[str, str] = {
     "account": get_config_value("account", "SNOWFLAKE_ACCOUNT"),
@@ -79,31 +99,114 @@ APP_CONFIG = {
 # Helper Function to Get Session
 # ============================================================================
 
+# Guards creation of the shared session/connection across threads
+_CONNECT_LOCK = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _create_session():
+    """Open the process-wide Snowpark session and close it on interpreter exit."""
+    from snowflake.snowpark import Session
+    
+    session = Session.builder.configs(SNOWFLAKE_CONFIG).create()
+    atexit.register(session.close)
+    print(f"✅ Connected to Snowflake: {SNOWFLAKE_CONFIG['database']}.{SNOWFLAKE_CONFIG['schema']}")
+    return session
+
 def get_snowflake_session():
     """
-    Create and return a Snowflake session.
+    Return the shared Snowflake session, creating it on first use.
+    Callers should not close it; it is closed when the process exits.
     Reference: https://docs.snowflake.com/en/developer-guide/snowpark/python/creating-session
     """
-    from snowflake.snowpark import Session
-    
     try:
-        session = Session.builder.configs(SNOWFLAKE_CONFIG).create()
-        print(f"✅ Connected to Snowflake: {SNOWFLAKE_CONFIG['database']}.{SNOWFLAKE_CONFIG['schema']}")
+        with _CONNECT_LOCK:
+            session = _create_session()
+            if session.connection.is_closed():
+                # A caller closed the shared session - reconnect
+                _create_session.cache_clear()
+                session = _create_session()
         return session
     except Exception as e:
         print(f"❌ Failed to connect to Snowflake: {e}")
         raise
 
+@lru_cache(maxsize=1)
+def _create_connector():
+    """Open the process-wide connector connection and close it on interpreter exit."""
+    import snowflake.connector
+    
+    conn = snowflake.connector.connect(**SNOWFLAKE_CONFIG)
+    atexit.register(conn.close)
+    print(f"✅ Connected to Snowflake via connector")
+    return conn
+
 def get_snowflake_connector():
     """
-    Create and return a Snowflake connector (for non-Snowpark operations).
+    Return the shared Snowflake connector (for non-Snowpark operations),
+    creating it on first use. Callers should not close it.
     """
-    import snowflake.connector
-    
     try:
-        conn = snowflake.connector.connect(**SNOWFLAKE_CONFIG)
-        print(f"✅ Connected to Snowflake via connector")
+        with _CONNECT_LOCK:
+            conn = _create_connector()
+            if conn.is_closed():
+                _create_connector.cache_clear()
+                conn = _create_connector()
         return conn
     except Exception as e:
         print(f"❌ Failed to connect to Snowflake: {e}")
         raise
+
+def fetch_pandas(session, sql: str, params=None):
+    """
+    Run a query on the session's connector cursor and build the DataFrame
+    from Arrow result batches, skipping Snowpark's row conversion.
+    Binding uses qmark (?) placeholders, as with session.sql(params=...).
+    """
+    import pandas as pd
+    
+    cursor = session.connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        batches = list(cursor.fetch_pandas_batches())
+        columns = [c.name for c in cursor.description]
+    finally:
+        cursor.close()
+    
+    if not batches:
+        return pd.DataFrame(columns=columns)
+    return batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True)
+
+def copy_via_parquet(session, df, table_name: str, overwrite: bool = False):
+    """
+    Load a DataFrame into an existing table by writing it to a local Parquet
+    file, PUTting that to the table's stage and running one COPY INTO.
+    Columns are matched by name; the staged file is purged once loaded.
+    With overwrite=True the existing rows are deleted first (as write_pandas
+    does), in the same transaction as the COPY, so a failed load keeps them.
+    """
+    stage = f"@%{table_name}"
+    # Unique per upload so concurrent loads into one table never share a file
+    file_name = f"{table_name.lower()}_{uuid.uuid4().hex}.parquet"
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = os.path.join(tmp_dir, file_name)
+        df.to_parquet(local_path, compression='snappy', index=False)
+        session.file.put(local_path, stage, auto_compress=False, overwrite=True)
+    
+    session.sql("BEGIN").collect()
+    try:
+        if overwrite:
+            # DELETE rather than TRUNCATE so it rolls back with a failed COPY
+            session.sql(f"DELETE FROM {table_name}").collect()
+        session.sql(f"""
+            COPY INTO {table_name}
+            FROM {stage}/{file_name}
+            FILE_FORMAT = (TYPE = PARQUET USE_VECTORIZED_SCANNER = TRUE)
+            MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+            PURGE = TRUE
+        """).collect()
+        session.sql("COMMIT").collect()
+    except Exception:
+        session.sql("ROLLBACK").collect()
+        session.sql(f"REMOVE {stage}/{file_name}").collect()
+        raise
@@ -4,11 +4,65 @@ Uses Snowflake's native ML capabilities for advanced forecasting
 Reference: https://docs.snowflake.com/en/user-guide/ml-functions
 """
 
-from snowflake.snowpark import Session
-from snowflake.snowpark.functions import col, call_builtin
+import json
+from typing import TYPE_CHECKING
 import pandas as pd
-from datetime import datetime, timedelta
-from config import get_snowflake_session
+from config import get_snowflake_session, fetch_pandas
+
+if TYPE_CHECKING:
+    from snowflake.snowpark import Session
+
+
+# Per-item queries; placeholders are (location, item)
+ITEM_FORECAST_SQL = """
+SELECT
+    location,
+    item,
+    last_updated_date as record_date,
+    issued_qty as actual_usage,
+    SNOWFLAKE.ML.FORECAST(
+        issued_qty,
+        last_updated_date
+    ) OVER (
+        PARTITION BY location, item
+        ORDER BY last_updated_date
+        ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+    ) as forecasted_usage
+FROM RAW_STOCK
+WHERE location = ?
+AND item = ?
+ORDER BY last_updated_date
+"""
+
+# Upsert staged forecasts so re-runs only rewrite the (location, item, date) rows they produce
+MERGE_FORECASTS_SQL = """
+MERGE INTO cortex_forecasts t
+USING cortex_forecasts_stg s
+ON t.location = s.location
+AND t.item = s.item
+AND t.forecast_date = s.forecast_date
+WHEN MATCHED THEN UPDATE SET
+    forecasted_usage = s.forecasted_usage,
+    confidence_interval_lower = s.confidence_interval_lower,
+    confidence_interval_upper = s.confidence_interval_upper,
+    model_type = s.model_type,
+    created_at = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED THEN INSERT (
+    location, item, forecast_date, forecasted_usage,
+    confidence_interval_lower, confidence_interval_upper, model_type
+) VALUES (
+    s.location, s.item, s.forecast_date, s.forecasted_usage,
+    s.confidence_interval_lower, s.confidence_interval_upper, s.model_type
+)
+"""
+
+ITEM_HISTORY_SQL = """
+SELECT last_updated_date as record_date, issued_qty as issued
+FROM RAW_STOCK
+WHERE location = ?
+AND item = ?
+ORDER BY last_updated_date
+"""
 
 
 class CortexAIForecaster:
@@ -17,9 +71,13 @@ class CortexAIForecaster:
     Leverages Snowflake's built-in ML functions for time-series prediction.
     """
     
-    def __init__(self, session: Session):
+    def __init__(self, session: 'Session'):
         self.session = session
     
+    def _fetch_df(self, sql: str, params=None) -> pd.DataFrame:
+        """Fetch a query result as pandas via the connector's Arrow batches."""
+        return fetch_pandas(self.session, sql, params)
+    
     def create_forecast_model(self, location: str, item: str, forecast_days: int = 7):
         """
         Create time-series forecast using Snowflake Cortex AI.
@@ -36,27 +94,7 @@ class CortexAIForecaster:
         
         try:
             # Use Snowflake's FORECAST function (Cortex AI)
-            forecast_query = f"""
-            SELECT
-                location,
-                item,
-                last_updated_date as record_date,
-                issued_qty as actual_usage,
-                SNOWFLAKE.ML.FORECAST(
-                    issued_qty,
-                    last_updated_date
-                ) OVER (
-                    PARTITION BY location, item
-                    ORDER BY last_updated_date
-                    ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-                ) as forecasted_usage
-            FROM RAW_STOCK
-            WHERE location = '{location}'
-            AND item = '{item}'
-            ORDER BY last_updated_date
-            """
-            
-            result = self.session.sql(forecast_query).to_pandas()
+            result = self._fetch_df(ITEM_FORECAST_SQL, [location, item])
             
             if not result.empty:
                 print(f"✅ Cortex AI forecast created: {len(result)} data points")
@@ -77,68 +115,123 @@ class CortexAIForecaster:
         print("📊 Using exponential smoothing fallback...")
         
         # Get historical data
-        data = self.session.sql(f"""
-            SELECT last_updated_date as record_date, issued_qty as issued
-            FROM RAW_STOCK
-            WHERE location = '{location}'
-            AND item = '{item}'
-            ORDER BY last_updated_date
-        """).to_pandas()
+        data = self._fetch_df(ITEM_HISTORY_SQL, [location, item])
         
         if data.empty:
             return None
         
         # Simple exponential smoothing
         alpha = 0.3  # Smoothing factor
-        forecast = []
         
-        # Initialize with first value
+        # Seeded with the first value: s_t = alpha * x_t + (1 - alpha) * s_{t-1},
+        # evaluated by pandas' compiled ewm kernel
         # Snowflake returns uppercase columns
-        s = data['ISSUED'].iloc[0]
-        
-        for value in data['ISSUED']:
-            s = alpha * value + (1 - alpha) * s
-            forecast.append(s)
-        
-        data['forecasted_usage'] = forecast
+        data['forecasted_usage'] = data['ISSUED'].astype('float64').ewm(alpha=alpha, adjust=False).mean()
         data['location'] = location
         data['item'] = item
         
         return data
     
+    def iter_forecast_batches(self, forecast_days: int = 7):
+        """
+        Yield forecasts for all location-item combinations as DataFrame batches.
+        Trains one multi-series Cortex model over every (location, item) pair
+        and streams its output batch by batch; falls back to per-item forecasts
+        if the ML functions are unavailable.
+        """
+        print("🚀 Starting batch Cortex AI forecasting...")
+        
+        try:
+            batches = self._cortex_forecast_batches(forecast_days)
+        except Exception as e:
+            print(f"⚠️ Batch Cortex AI forecast not available, forecasting per item: {e}")
+            yield from self._forecast_items_individually(forecast_days)
+            return
+        
+        for batch in batches:
+            yield _reshape_cortex_forecast(batch)
+    
+    def _cortex_forecast_batches(self, forecast_days: int):
+        """
+        Train the multi-series model, run its forecast and return an iterator
+        over the raw result as pandas batches read straight from the cursor.
+        """
+        # One series per (location, item), keyed by a [location, item] array
+        self.session.sql("""
+            CREATE OR REPLACE VIEW cortex_forecast_input AS
+            SELECT
+                ARRAY_CONSTRUCT(location, item) as series,
+                last_updated_date::TIMESTAMP_NTZ as ts,
+                issued_qty as issued
+            FROM RAW_STOCK
+        """).collect()
+        
+        self.session.sql("""
+            CREATE OR REPLACE SNOWFLAKE.ML.FORECAST stock_usage_forecast(
+                INPUT_DATA => SYSTEM$REFERENCE('VIEW', 'cortex_forecast_input'),
+                SERIES_COLNAME => 'series',
+                TIMESTAMP_COLNAME => 'ts',
+                TARGET_COLNAME => 'issued'
+            )
+        """).collect()
+        
+        cursor = self.session.connection.cursor()
+        try:
+            cursor.execute("CALL stock_usage_forecast!FORECAST(FORECASTING_PERIODS => ?)", [forecast_days])
+            # Re-read the CALL output as a query so it arrives as Arrow batches
+            cursor.execute("SELECT * FROM TABLE(RESULT_SCAN(?))", [cursor.sfqid])
+        except Exception:
+            cursor.close()
+            raise
+        
+        def stream():
+            try:
+                yield from cursor.fetch_pandas_batches()
+            finally:
+                cursor.close()
+        
+        return stream()
+    
     def batch_forecast_all_items(self, forecast_days: int = 7):
         """
         Create forecasts for all location-item combinations.
+        Collects iter_forecast_batches() into one DataFrame.
         """
-        print("🚀 Starting batch Cortex AI forecasting...")
+        all_forecasts = [batch for batch in self.iter_forecast_batches(forecast_days) if not batch.empty]
         
+        if all_forecasts:
+            combined = pd.concat(all_forecasts, ignore_index=True)
+            print(f"\n✅ Batch forecasting complete: {len(combined)} forecast rows")
+            return combined
+        else:
+            print("⚠️ No forecasts generated")
+            return None
+    
+    def _forecast_items_individually(self, forecast_days: int):
+        """
+        Forecast each location-item combination with its own query,
+        yielding one DataFrame per item.
+        """
         # Get all unique location-item combinations
         combinations = self.session.sql("""
             SELECT DISTINCT location, item
             FROM RAW_STOCK
         """).collect()
         
-        all_forecasts = []
-        
         for row in combinations:
             location = row['LOCATION']
             item = row['ITEM']
             
             forecast = self.create_forecast_model(location, item, forecast_days)
             if forecast is not None:
-                all_forecasts.append(forecast)
-        
-        if all_forecasts:
-            combined = pd.concat(all_forecasts, ignore_index=True)
-            print(f"\n✅ Batch forecasting complete: {len(all_forecasts)} items")
-            return combined
-        else:
-            print("⚠️ No forecasts generated")
-            return None
+                yield _reshape_item_forecast(forecast)
     
-    def save_cortex_forecasts(self, forecasts_df: pd.DataFrame):
+    def save_cortex_forecasts(self, forecasts):
         """
         Save Cortex AI forecasts to Snowflake table.
+        Accepts a DataFrame or an iterable of DataFrame batches; batches are
+        staged as they arrive, so the full forecast set never sits in memory,
+        then merged into cortex_forecasts on (location, item, forecast_date).
         """
         try:
             # Create or replace forecast table
@@ -155,20 +248,74 @@ class CortexAIForecaster:
                 )
             """).collect()
             
-            # Save forecasts
-            self.session.write_pandas(
-                forecasts_df,
-                "cortex_forecasts",
-                auto_create_table=False,
-                overwrite=True
-            )
+            # Session-scoped staging table with the target's columns; dropped on disconnect
+            self.session.sql(
+                "CREATE OR REPLACE TEMPORARY TABLE cortex_forecasts_stg LIKE cortex_forecasts"
+            ).collect()
+            
+            batches = [forecasts] if isinstance(forecasts, pd.DataFrame) else forecasts
+            saved = 0
+            
+            # Stage forecasts batch by batch
+            for batch in batches:
+                if batch.empty:
+                    continue
+                self.session.write_pandas(
+                    batch,
+                    "CORTEX_FORECASTS_STG",
+                    auto_create_table=False,
+                    overwrite=False,
+                    chunk_size=100_000,
+                    parallel=8,
+                    compression="snappy",
+                    use_logical_type=True,
+                    quote_identifiers=False
+                )
+                saved += len(batch)
             
-            print(f"✅ Saved {len(forecasts_df)} Cortex AI forecasts to Snowflake")
+            if saved == 0:
+                print("⚠️ No forecasts to save")
+                return
+            
+            self.session.sql(MERGE_FORECASTS_SQL).collect()
+            print(f"✅ Saved {saved} Cortex AI forecasts to Snowflake")
             
         except Exception as e:
             print(f"❌ Error saving forecasts: {e}")
 
 
+def _reshape_cortex_forecast(result: pd.DataFrame) -> pd.DataFrame:
+    """Map raw !FORECAST output onto the cortex_forecasts columns."""
+    # SERIES comes back as a JSON array string: ["<location>", "<item>"]
+    series = result['SERIES'].map(json.loads)
+    return pd.DataFrame({
+        'location': series.str[0],
+        'item': series.str[1],
+        'forecast_date': pd.to_datetime(result['TS']).dt.date,
+        'forecasted_usage': result['FORECAST'],
+        'confidence_interval_lower': result['LOWER_BOUND'],
+        'confidence_interval_upper': result['UPPER_BOUND'],
+        'model_type': 'CORTEX_ML_FORECAST',
+    })
+
+
+def _reshape_item_forecast(result: pd.DataFrame) -> pd.DataFrame:
+    """Map a per-item forecast (Cortex window query or smoothing fallback) onto the cortex_forecasts columns."""
+    # The fallback adds lowercase columns to the uppercase history columns
+    result = result.rename(columns=str.upper)
+    # Only the smoothing fallback carries the raw ISSUED history
+    model_type = 'EXPONENTIAL_SMOOTHING' if 'ISSUED' in result.columns else 'CORTEX_ML_FORECAST'
+    return pd.DataFrame({
+        'location': result['LOCATION'],
+        'item': result['ITEM'],
+        'forecast_date': pd.to_datetime(result['RECORD_DATE']).dt.date,
+        'forecasted_usage': result['FORECASTED_USAGE'].astype('float64'),
+        'confidence_interval_lower': float('nan'),
+        'confidence_interval_upper': float('nan'),
+        'model_type': model_type,
+    })
+
+
 def run_cortex_forecasting():
     """
     Main function to run Cortex AI forecasting.
@@ -181,18 +328,23 @@ def run_cortex_forecasting():
         session = get_snowflake_session()
         forecaster = CortexAIForecaster(session)
         
-        # Run batch forecasting
-        forecasts = forecaster.batch_forecast_all_items(forecast_days=7)
+        # Run batch forecasting, keeping only per-item running totals for the summary
+        totals = []
         
-        if forecasts is not None:
-            # Save to Snowflake
-            forecaster.save_cortex_forecasts(forecasts)
-            
+        def track(batches):
+            for batch in batches:
+                totals.append(batch.groupby(['location', 'item'])['forecasted_usage'].agg(['sum', 'count']))
+                yield batch
+        
+        # Save to Snowflake as the batches stream in
+        forecaster.save_cortex_forecasts(track(forecaster.iter_forecast_batches(forecast_days=7)))
+        
+        if totals:
             # Show summary
+            summary = pd.concat(totals).groupby(level=['location', 'item']).sum()
             print("\n📊 Forecast Summary:")
-            print(forecasts.groupby(['location', 'item'])['forecasted_usage'].mean())
+            print((summary['sum'] / summary['count']).rename('forecasted_usage'))
         
-        session.close()
         print("\n✅ Cortex AI forecasting completed")
         
     except Exception as e:
@@ -6,15 +6,54 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'python'))
 from config import get_snowflake_session
 
-def create_views():
-    """Create cost optimization and stockout impact views."""
+ADVANCED_TABLES = ('STOCKOUT_IMPACT', 'BUDGET_TRACKING')
+
+
+def drop_legacy_views(session, names=ADVANCED_TABLES):
+    """
+    Drop plain views left by earlier versions under names that are now
+    dynamic tables. CREATE OR REPLACE DYNAMIC TABLE cannot replace a view,
+    and DROP VIEW fails on a dynamic table, so only names that SHOW VIEWS
+    actually lists are dropped. Returns the names dropped.
+    """
+    views = {row['name'] for row in session.sql("SHOW VIEWS IN SCHEMA").collect()}
+    dropped = [name for name in names if name in views]
+    for name in dropped:
+        session.sql(f"DROP VIEW {name}").collect()
+        print(f"🔄 Dropped legacy view {name} (now a dynamic table)")
+    return dropped
+
+
+def create_views(rebuild=False):
+    """
+    Create cost optimization and stockout impact views.
+    Both are dynamic tables that refresh themselves when their inputs change,
+    so once they exist they are only recreated when rebuild=True.
+    """
     session = get_snowflake_session()
     
-    print("Creating Stockout Impact view...")
+    existing = {row['name'] for row in session.sql("SHOW DYNAMIC TABLES IN SCHEMA").collect()}
+    if not rebuild and all(name in existing for name in ADVANCED_TABLES):
+        print("✅ Stockout Impact and Budget Tracking tables already exist (refreshed by Snowflake)")
+        print("   Run with --rebuild to recreate them")
+        return
+    
+    print("Creating Stockout Impact table...")
+    
+    # Dynamic tables keep the joined result materialized and refresh it when
+    # STOCK_HEALTH / REORDER_RECOMMENDATIONS change, so dashboard reads are
+    # plain scans. TARGET_LAG matches those upstream tables (dynamic_tables.sql):
+    # a refresh with no upstream change is skipped without using the warehouse,
+    # so these only run when the upstream tables have just refreshed anyway.
+    # Earlier versions created these as views; drop those first.
+    drop_legacy_views(session)
     
-    # Stockout Impact View - quote lowercase columns
+    # Stockout Impact - ordering is left to the consuming queries
     stockout_query = """
-    CREATE OR REPLACE VIEW stockout_impact AS
+    CREATE OR REPLACE DYNAMIC TABLE stockout_impact
+        TARGET_LAG = '1 minute'
+        WAREHOUSE = compute_wh
+        AS
     SELECT
         h.location,
         h.item,
@@ -52,28 +91,52 @@ def create_views():
     FROM STOCK_HEALTH h
     LEFT JOIN ABC_ANALYSIS a ON h.item = a.item
     WHERE h.STOCK_STATUS IN ('OUT_OF_STOCK', 'CRITICAL', 'WARNING')
-    ORDER BY ACTION_PRIORITY, PATIENTS_AFFECTED_UNTIL_STOCKOUT DESC
     """
     
-    session.sql(stockout_query).collect()
-    print("✅ Stockout Impact view created")
+    # Submitted asynchronously; the budget table is built while this one runs
+    stockout_job = session.sql(stockout_query).collect_nowait()
     
-    # Budget Tracking View
-    print("Creating Budget Tracking view...")
+    # Budget Tracking - unit prices come from the item_prices reference table
+    # (sql/advanced_analytics.sql); make sure it exists with the defaults
+    # this script used to hard-code, without overwriting maintained prices.
+    # Where that script has seeded prices (e.g. Oxygen Cylinders at 2000),
+    # those are used instead of the flat default of 10
+    print("Creating Budget Tracking table...")
+    
+    session.sql("""
+    CREATE TABLE IF NOT EXISTS item_prices (
+        item STRING PRIMARY KEY,
+        unit_price NUMBER(10,2),
+        currency STRING DEFAULT 'INR',
+        price_effective_date DATE DEFAULT CURRENT_DATE(),
+        price_category STRING
+    ) COMMENT = 'Reference prices for ABC analysis'
+    """).collect()
+    
+    session.sql("""
+    MERGE INTO item_prices AS target
+    USING (
+        SELECT 'Insulin' AS item, 500.00 AS unit_price
+        UNION ALL
+        SELECT 'ORS', 10.00
+        UNION ALL
+        SELECT 'Paracetamol', 5.00
+    ) AS source
+    ON target.item = source.item
+    WHEN NOT MATCHED THEN INSERT (item, unit_price) VALUES (source.item, source.unit_price)
+    """).collect()
     
     budget_query = """
-    CREATE OR REPLACE VIEW budget_tracking AS
+    CREATE OR REPLACE DYNAMIC TABLE budget_tracking
+        TARGET_LAG = '1 minute'
+        WAREHOUSE = compute_wh
+        AS
     WITH monthly_procurement AS (
         SELECT
-            SUM(r.REORDER_QUANTITY * 
-                CASE r.item
-                    WHEN 'Insulin' THEN 500
-                    WHEN 'ORS' THEN 10
-                    WHEN 'Paracetamol' THEN 5
-                    ELSE 10
-                END
-            ) AS ESTIMATED_SPEND
+            -- Items without a reference price are costed at 10
+            SUM(r.REORDER_QUANTITY * COALESCE(p.unit_price, 10)) AS ESTIMATED_SPEND
         FROM REORDER_RECOMMENDATIONS r
+        LEFT JOIN item_prices p ON r.item = p.item
     )
     SELECT
         100000 AS MONTHLY_BUDGET,
@@ -89,14 +152,24 @@ def create_views():
     FROM monthly_procurement m
     """
     
-    session.sql(budget_query).collect()
-    print("✅ Budget Tracking view created")
+    budget_job = session.sql(budget_query).collect_nowait()
+    
+    stockout_job.result()
+    print("✅ Stockout Impact table created")
+    budget_job.result()
+    print("✅ Budget Tracking table created")
     
     # Verify
-    stockout_result = session.sql("SELECT * FROM stockout_impact").to_pandas()
-    print(f"\n✅ Stockout Impact has {len(stockout_result)} items")
-    if len(stockout_result) > 0:
-        print(stockout_result[['LOCATION', 'ITEM', 'IMPACT_SEVERITY', 'ACTION_PRIORITY']].head())
+    # Count and top rows are computed in Snowflake; only 5 rows come back
+    stockout_count = session.sql("SELECT COUNT(*) FROM stockout_impact").collect()[0][0]
+    print(f"\n✅ Stockout Impact has {stockout_count} items")
+    if stockout_count > 0:
+        print(session.sql("""
+            SELECT location, item, IMPACT_SEVERITY, ACTION_PRIORITY
+            FROM stockout_impact
+            ORDER BY ACTION_PRIORITY, PATIENTS_AFFECTED_UNTIL_STOCKOUT DESC
+            LIMIT 5
+        """).to_pandas())
     else:
         print("   (No critical/warning items currently)")
     
@@ -105,4 +178,4 @@ def create_views():
     print(budget_result)
 
 if __name__ == "__main__":
-    create_views()
+    create_views(rebuild='--rebuild' in sys.argv)
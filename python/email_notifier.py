@@ -1,47 +1,34 @@
 import os
 import smtplib
+import time
+from email.charset import Charset, QP
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import pandas as pd
 from datetime import datetime
+from string import Template
 from dotenv import load_dotenv
 
 load_dotenv()
 
-class EmailNotifier:
-    """Sends email notifications for stock alerts."""
-    
-    def __init__(self):
-        self.enabled = os.getenv("EMAIL_NOTIFICATIONS_ENABLED", "false").lower() == "true"
-        self.host = os.getenv("SMTP_HOST", "smtp.gmail.com")
-        self.port = int(os.getenv("SMTP_PORT", "587"))
-        self.user = os.getenv("SMTP_USER")
-        self.password = os.getenv("SMTP_PASSWORD")
-        self.from_email = os.getenv("EMAIL_FROM")
-        self.from_name = os.getenv("EMAIL_FROM_NAME", "StockPulse 360")
-        self.to_emails = os.getenv("EMAIL_TO", "").split(",")
-    
-    def send_alert_email(self, alerts_df: pd.DataFrame):
-        """Send formatted HTML email with critical alerts."""
-        if not self.enabled:
-            return
-            
-        if alerts_df is None or alerts_df.empty:
-            print("ℹ️ Email: No alerts provided.")
-            return
-            
-        # Filter for high priority items
-        critical_items = alerts_df[alerts_df['STOCK_STATUS'].isin(['OUT_OF_STOCK', 'CRITICAL', 'WARNING'])]
-        if critical_items.empty:
-            print(f"ℹ️ Email: Skipping {len(alerts_df)} alerts (none are OUT_OF_STOCK, CRITICAL, or WARNING).")
-            return
+EMAIL_ALERT_COLUMNS = ['LOCATION', 'ITEM', 'STOCK_STATUS', 'CURRENT_STOCK', 'DAYS_UNTIL_STOCKOUT']
+# Status text colour in the alert table
+EMAIL_STATUS_COLORS = {
+    'OUT_OF_STOCK': "#DC143C",
+    'CRITICAL': "#FFA500",
+    'WARNING': "#FFA500",
+}
 
-        print(f"📧 Preparing email for {len(critical_items)} critical items...")
-        
-        subject = f"🚨 URGENT: {len(critical_items)} Critical Stock Alerts - StockPulse 360"
-        
-        # Build HTML content
-        html = f"""
+# An open SMTP connection idle longer than this is probed with NOOP before reuse
+SMTP_KEEPALIVE_SECONDS = 30
+
+# The alert HTML is mostly ASCII, so quoted-printable sends it nearly as-is
+# where the default base64 would grow every byte by a third
+_HTML_CHARSET = Charset('utf-8')
+_HTML_CHARSET.body_encoding = QP
+
+# Static shell of the alert email; only the rows and timestamp change per send
+_HTML_TEMPLATE = Template("""
         <html>
         <body style="font-family: 'Segoe UI', Arial, sans-serif; color: #333; line-height: 1.6;">
             <div style="background-color: #0F4C81; color: white; padding: 20px; border-radius: 10px 10px 0 0;">
@@ -62,23 +49,7 @@ class EmailNotifier:
                         </tr>
                     </thead>
                     <tbody>
-        """
-        
-        for _, alert in critical_items.iterrows():
-            status_color = "#DC143C" if alert['STOCK_STATUS'] == 'OUT_OF_STOCK' else "#FFA500"
-            html += f"""
-                        <tr>
-                            <td style="padding: 12px; border-bottom: 1px solid #EEE;">{alert['LOCATION']}</td>
-                            <td style="padding: 12px; border-bottom: 1px solid #EEE;"><b>{alert['ITEM']}</b></td>
-                            <td style="padding: 12px; border-bottom: 1px solid #EEE;">
-                                <span style="color: {status_color}; font-weight: bold;">{alert['STOCK_STATUS']}</span>
-                            </td>
-                            <td style="padding: 12px; border-bottom: 1px solid #EEE;">{alert['CURRENT_STOCK']:.0f} units</td>
-                            <td style="padding: 12px; border-bottom: 1px solid #EEE;">{alert['DAYS_UNTIL_STOCKOUT']:.1f} days</td>
-                        </tr>
-            """
-            
-        html += """
+$alert_rows
                     </tbody>
                 </table>
                 
@@ -88,15 +59,131 @@ class EmailNotifier:
                 
                 <p style="margin-top: 20px; font-size: 12px; color: #777;">
                     This is an automated message from StockPulse 360 AI-Driven Stock Monitor.<br>
-                    Timestamp: """ + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + """
+                    Timestamp: $timestamp
                 </p>
             </div>
         </body>
         </html>
-        """
+        """)
+
+class EmailNotifier:
+    """Sends email notifications for stock alerts."""
+    
+    def __init__(self):
+        self.enabled = os.getenv("EMAIL_NOTIFICATIONS_ENABLED", "false").lower() == "true"
+        self.host = os.getenv("SMTP_HOST", "smtp.gmail.com")
+        self.port = int(os.getenv("SMTP_PORT", "587"))
+        self.user = os.getenv("SMTP_USER")
+        self.password = os.getenv("SMTP_PASSWORD")
+        self.from_email = os.getenv("EMAIL_FROM")
+        self.from_name = os.getenv("EMAIL_FROM_NAME", "StockPulse 360")
+        self.to_emails = os.getenv("EMAIL_TO", "").split(",")
+        self._server = None  # Held open between sends inside a `with` block
+        self._holding = False
+        self._depth = 0  # Nesting level of `with` blocks; only the outermost connects
+        self._last_used = 0.0
+    
+    def __enter__(self):
+        """Keep one SMTP connection open for every email sent in the block."""
+        self._depth += 1
+        if self._depth == 1 and self.enabled:
+            try:
+                self._server = self._connect()
+                self._last_used = time.monotonic()
+                self._holding = True
+            except Exception as e:
+                # Sends fall back to one connection each
+                print(f"⚠️ Email: Could not open SMTP connection: {e}")
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            self._holding = False
+            self.close()
+    
+    def close(self):
+        """Close the held SMTP connection, if any."""
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+    
+    def send_many(self, alert_frames):
+        """Send one alert email per DataFrame over a single SMTP connection."""
+        with self:
+            for alerts_df in alert_frames:
+                self.send_alert_email(alerts_df)
+    
+    def send_alert_email(self, alerts_df: pd.DataFrame):
+        """Send formatted HTML email with critical alerts."""
+        if not self.enabled:
+            return
+            
+        if alerts_df is None or alerts_df.empty:
+            print("ℹ️ Email: No alerts provided.")
+            return
+            
+        # Count statuses in one pass; the filter is only applied when some rows
+        # fall outside OUT_OF_STOCK / CRITICAL / WARNING
+        counts = alerts_df['STOCK_STATUS'].value_counts().reindex(list(EMAIL_STATUS_COLORS), fill_value=0)
+        critical_count = int(counts.sum())
+        if critical_count == 0:
+            print(f"ℹ️ Email: Skipping {len(alerts_df)} alerts (none are OUT_OF_STOCK, CRITICAL, or WARNING).")
+            return
+        
+        if critical_count == len(alerts_df):
+            critical_items = alerts_df
+        else:
+            critical_items = alerts_df[alerts_df['STOCK_STATUS'].isin(list(EMAIL_STATUS_COLORS))]
+
+        print(f"📧 Preparing email for {critical_count} critical items...")
+        
+        subject = f"🚨 URGENT: {critical_count} Critical Stock Alerts - StockPulse 360"
+        
+        # Build HTML content: rows are joined once and dropped into the static
+        # template; colours are looked up for the whole column, not per row
+        rows = critical_items[EMAIL_ALERT_COLUMNS].assign(
+            STATUS_COLOR=critical_items['STOCK_STATUS'].map(EMAIL_STATUS_COLORS),
+            CURRENT_STOCK=critical_items['CURRENT_STOCK'].map('{:.0f}'.format),
+            DAYS_UNTIL_STOCKOUT=critical_items['DAYS_UNTIL_STOCKOUT'].map('{:.1f}'.format),
+        )
+        alert_rows = "".join(_row_to_html(alert) for alert in rows.itertuples(index=False))
+        html = _HTML_TEMPLATE.substitute(
+            alert_rows=alert_rows,
+            timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
         
         self._send(subject, html)
 
+    def _connect(self):
+        """Open an authenticated SMTP connection."""
+        server = smtplib.SMTP(self.host, self.port)
+        try:
+            server.starttls()
+            server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def _held_server(self):
+        """
+        Return the connection held by a `with` block, reconnecting if the
+        server dropped it while idle or a failed send discarded it.
+        """
+        if self._server is None:
+            self._server = self._connect()
+        elif time.monotonic() - self._last_used > SMTP_KEEPALIVE_SECONDS:
+            try:
+                self._server.noop()
+            except (smtplib.SMTPException, OSError):
+                self._server = self._connect()
+        self._last_used = time.monotonic()
+        return self._server
+    
     def _send(self, subject, html_content):
         """Execute the SMTP send process."""
         try:
@@ -105,26 +192,39 @@ class EmailNotifier:
             msg['To'] = ", ".join([e.strip() for e in self.to_emails])
             msg['Subject'] = subject
             
-            msg.attach(MIMEText(html_content, 'html'))
+            msg.attach(MIMEText(html_content, 'html', _HTML_CHARSET))
             
-            with smtplib.SMTP(self.host, self.port) as server:
-                server.starttls()
-                server.login(self.user, self.password)
-                server.send_message(msg)
+            if self._holding:
+                self._held_server().send_message(msg)
+            else:
+                with self._connect() as server:
+                    server.send_message(msg)
                 
             print(f"✅ Alert email sent successfully to {len(self.to_emails)} recipients")
         except Exception as e:
             print(f"❌ Failed to send alert email: {e}")
+            # The held connection may be broken; the next send opens a new one
+            self.close()
+
+def _row_to_html(alert) -> str:
+    """Build the HTML table row for a single alert row (numbers pre-formatted)."""
+    return f"""
+                        <tr>
+                            <td style="padding: 12px; border-bottom: 1px solid #EEE;">{alert.LOCATION}</td>
+                            <td style="padding: 12px; border-bottom: 1px solid #EEE;"><b>{alert.ITEM}</b></td>
+                            <td style="padding: 12px; border-bottom: 1px solid #EEE;">
+                                <span style="color: {alert.STATUS_COLOR}; font-weight: bold;">{alert.STOCK_STATUS}</span>
+                            </td>
+                            <td style="padding: 12px; border-bottom: 1px solid #EEE;">{alert.CURRENT_STOCK} units</td>
+                            <td style="padding: 12px; border-bottom: 1px solid #EEE;">{alert.DAYS_UNTIL_STOCKOUT} days</td>
+                        </tr>
+            """
 
 if __name__ == "__main__":
     # Test script
-    test_data = pd.DataFrame([{
-        'LOCATION': 'Mumbai',
-        'ITEM': 'Insulin',
-        'STOCK_STATUS': 'OUT_OF_STOCK',
-        'CURRENT_STOCK': 0,
-        'DAYS_UNTIL_STOCKOUT': 0,
-        'ALERT_MESSAGE': 'Critical stockout at Mumbai hospital'
-    }])
+    test_data = pd.DataFrame.from_records(
+        [('Mumbai', 'Insulin', 'OUT_OF_STOCK', 0, 0.0, 'Critical stockout at Mumbai hospital')],
+        columns=EMAIL_ALERT_COLUMNS + ['ALERT_MESSAGE']
+    ).astype({'CURRENT_STOCK': 'int32', 'DAYS_UNTIL_STOCKOUT': 'float32'})
     notifier = EmailNotifier()
     notifier.send_alert_email(test_data)
@@ -5,7 +5,8 @@ Generates realistic stock data with multiple locations and items
 
 import pandas as pd
 import numpy as np
-import random
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from datetime import datetime, timedelta
 import os
 
@@ -25,58 +26,71 @@ ITEMS = [
 END_DATE = datetime.now()
 START_DATE = END_DATE - timedelta(days=60)
 
-def generate_realistic_stock_data(num_days=60):
-    """Generate realistic stock movement data."""
+def _simulate_stock(stock0, issued_frac, received, out_stock, out_issued):
+    """
+    Run the daily stock recurrence for every location-item pair at once.
+    Each day reads the previous day's row of out_stock and is written in
+    place, so no temporaries are allocated inside the loop.
+    """
+    previous = stock0
+    for day in range(len(issued_frac)):
+        issued, stock = out_issued[day], out_stock[day]
+        # Never more than available, since the fraction is below 1
+        np.multiply(previous, issued_frac[day], out=issued, casting='unsafe')
+        # Update stock (can't go negative)
+        np.subtract(previous, issued, out=stock)
+        np.add(stock, received[day], out=stock)
+        np.maximum(stock, 0, out=stock)
+        previous = stock
+
+
+def generate_realistic_stock_data(num_days=60, seed=None):
+    """
+    Generate realistic stock movement data.
+    All random draws are made up front as (day, location, item) arrays; only
+    the day-to-day stock recurrence (_simulate_stock) loops, over whole arrays.
+    Every draw comes from one Generator, so passing a seed reproduces the data.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (num_days, len(LOCATIONS), len(ITEMS))
     
-    data = []
+    # Starting stock for each location-item combination: lower range to trigger alerts
+    stock = rng.integers(50, 251, shape[1:], dtype=np.int32)
     
-    # Initialize starting stock for each location-item combination
-    stock_levels = {}
-    for location in LOCATIONS:
-        for item in ITEMS:
-            # Starting stock: lower range to trigger alerts
-            stock_levels[(location, item)] = random.randint(50, 250)
+    # Simulate daily movements
+    # Issued (consumption): 5-30% of current stock
+    issued_frac = rng.uniform(0.05, 0.30, shape)
+    # Received (replenishment): Occasional replenishment (15% chance),
+    # lowered frequency to allow stock levels to drop
+    received = (rng.integers(50, 151, shape) * (rng.random(shape) < 0.15)).astype(np.int32)
     
-    # Generate daily records
-    for day in range(num_days):
-        current_date = START_DATE + timedelta(days=day)
-        for location in LOCATIONS:
-            for item in ITEMS:
-                key = (location, item)
-                current_stock = stock_levels[key]
-                
-                # Simulate daily movements
-                # Issued (consumption): 5-30% of current stock
-                issued = int(current_stock * np.random.uniform(0.05, 0.30))
-                issued = min(issued, current_stock)  # Can't issue more than available
-                
-                # Received (replenishment): Occasional replenishment (15% chance)
-                received = 0
-                if random.random() < 0.15: # Lowered frequency to allow stock levels to drop
-                    received = random.randint(50, 150)
-                
-                # Update stock
-                new_stock = current_stock - issued + received
-                new_stock = max(0, new_stock)  # Stock can't go negative
-                
-                # Record the day's data
-                data.append({
-                    'location': location,
-                    'item': item,
-                    'current_stock': new_stock,
-                    'issued_qty': issued,
-                    'received_qty': received,
-                    'last_updated_date': current_date.strftime('%Y-%m-%d')
-                })
-                
-                # Update stock level for next day
-                stock_levels[key] = new_stock
+    # Quantities stay in the hundreds, so int32 columns are plenty
+    issued = np.empty(shape, dtype=np.int32)
+    current_stock = np.empty(shape, dtype=np.int32)
+    _simulate_stock(stock, issued_frac, received, current_stock, issued)
     
-    return pd.DataFrame(data)
+    # Rows are ordered day, location, item
+    dates = pd.date_range(START_DATE, periods=num_days, freq='D').strftime('%Y-%m-%d')
+    pairs = len(LOCATIONS) * len(ITEMS)
+    return pd.DataFrame({
+        'location': np.tile(np.repeat(LOCATIONS, len(ITEMS)), num_days),
+        'item': np.tile(ITEMS, len(LOCATIONS) * num_days),
+        'current_stock': current_stock.ravel(),
+        'issued_qty': issued.ravel(),
+        'received_qty': received.ravel(),
+        'last_updated_date': np.repeat(dates, pairs),
+    })
 
 
 def main():
     """Generate and save stock data."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='StockPulse 360 Data Generator')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed; reuse it to reproduce a previous run\'s data')
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("StockPulse 360 - Data Generator")
     print("=" * 60)
@@ -89,7 +103,7 @@ def main():
     
     # Generate data
     print("\n⚙️  Generating realistic stock movements...")
-    df = generate_realistic_stock_data(num_days=60)
+    df = generate_realistic_stock_data(num_days=60, seed=args.seed)
     
     # Sort by date and location
     df = df.sort_values(['last_updated_date', 'location', 'item'])
@@ -100,7 +114,8 @@ def main():
     output_path = os.path.join(project_dir, 'data', 'stock_data.csv')
     
     print(f"\n💾 Saving to: {output_path}")
-    df.to_csv(output_path, index=False)
+    # pyarrow's C++ writer (text fields come out quoted, which both loaders accept)
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), output_path)
     
     print(f"✅ Generated {len(df):,} records")
     
@@ -2,69 +2,142 @@
 import os
 import sys
 import re
+from typing import Iterator
 from config import get_snowflake_session
+from create_advanced_views import drop_legacy_views
+
+# CREATE [OR REPLACE] [DYNAMIC|SECURE|TRANSIENT] TABLE/VIEW [IF NOT EXISTS] <name>
+CREATE_OBJECT_RE = re.compile(
+    r'^\s*CREATE\s+(?:OR\s+REPLACE\s+)?(?:(?:DYNAMIC|SECURE|TRANSIENT|TEMPORARY)\s+)?'
+    r'(?:TABLE|VIEW)\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w$."]+)',
+    re.IGNORECASE
+)
+
+def iter_statements(src: str) -> Iterator[str]:
+    """
+    Yield the statements of a SQL script in one pass over the text.
+    Comments are dropped; semicolons inside quoted strings or inside a
+    BEGIN ... END; block (Snowflake Tasks/Procedures) do not end a statement.
+    """
+    pieces = []  # Text of the current statement, minus comments
+    depth = 0
+    start = 0  # Start of the text not yet copied into pieces
+    i, n = 0, len(src)
+    
+    while i < n:
+        ch = src[i]
+        
+        if ch == '-' and src.startswith('--', i):
+            # Line comment: skip to the newline
+            pieces.append(src[start:i])
+            end = src.find('\n', i)
+            i = start = n if end == -1 else end
+        elif ch == '/' and src.startswith('/*', i):
+            # Block comment: skip past the closing */
+            pieces.append(src[start:i])
+            end = src.find('*/', i + 2)
+            i = start = n if end == -1 else end + 2
+        elif ch == "'" or ch == '"':
+            # Quoted string or identifier: skip to the closing quote
+            i += 1
+            while i < n and src[i] != ch:
+                i += 2 if src[i] == '\\' else 1
+            i += 1
+        elif ch.isalpha() or ch == '_':
+            # Whole word, so BEGIN/END are not matched inside identifiers
+            end = i + 1
+            while end < n and (src[end].isalnum() or src[end] in '_$'):
+                end += 1
+            word = src[i:end].upper()
+            if word == 'BEGIN':
+                depth += 1
+            elif word == 'END' and depth:
+                # Only END; closes a block - CASE ... END does not
+                after = end
+                while after < n and src[after] in ' \t':
+                    after += 1
+                if after < n and src[after] == ';':
+                    depth -= 1
+            i = end
+        elif ch == ';' and depth == 0:
+            # Semicolon outside of a block marks completion
+            pieces.append(src[start:i + 1])
+            statement = ''.join(pieces).strip()
+            if statement:
+                yield statement
+            pieces = []
+            i = start = i + 1
+        else:
+            i += 1
+    
+    # Final buffer
+    pieces.append(src[start:])
+    statement = ''.join(pieces).strip()
+    if statement:
+        yield statement
+
+def _parse_sql_file(file_path):
+    """Split a SQL file into statements."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    return tuple(stmt for stmt in iter_statements(content) if len(stmt) >= 5)
+
+def _statement_waves(statements):
+    """
+    Group statements into waves that can be submitted together.
+    A run of CREATE TABLE/VIEW statements shares a wave as long as none
+    references an object created earlier in the same wave; anything else
+    (USE, ALTER, INSERT, tasks, ...) runs in a wave of its own, in order.
+    """
+    wave, created = [], []
+    for stmt in statements:
+        match = CREATE_OBJECT_RE.match(stmt)
+        independent = match and not any(
+            re.search(r'\b' + re.escape(name) + r'\b', stmt, re.IGNORECASE) for name in created
+        )
+        if not independent and wave:
+            yield wave
+            wave, created = [], []
+        wave.append(stmt)
+        if match:
+            created.append(match.group(1).split('.')[-1])
+        else:
+            yield wave
+            wave, created = [], []
+    if wave:
+        yield wave
+
+def _report_sql_error(file_path, stmt, e):
+    # Ignore harmless errors
+    if "already exists" in str(e).lower() or "does not exist" in str(e).lower():
+        return
+    print(f"⚠️  Error executing statement in {os.path.basename(file_path)}: {e}")
+    print(f"   >>> Statement causing error: {stmt[:250]}...")
 
 def execute_sql_file(session, file_path):
     print(f"📄 Executing {os.path.basename(file_path)}...")
     if not os.path.exists(file_path):
         print(f"⚠️  File not found: {file_path}")
         return
-
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
     
-    # 1. Strip comments
-    content = re.sub(r'--.*', '', content)
-    content = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
+    statements = _parse_sql_file(file_path)
     
-    # 2. Split statements manually by tracking block depth
-    statements = []
-    buffer = []
-    depth = 0
-    
-    lines = content.split('\n')
-    for line in lines:
-        line_strip = line.strip()
-        if not line_strip:
-            continue
-            
-        buffer.append(line)
-        line_upper = line_strip.upper()
+    # Independent DDL in a wave is submitted asynchronously and awaited
+    # together, so the wave costs about one round-trip
+    for wave in _statement_waves(statements):
+        jobs = []
+        for stmt in wave:
+            try:
+                jobs.append((stmt, session.sql(stmt).collect_nowait()))
+            except Exception as e:
+                _report_sql_error(file_path, stmt, e)
         
-        # Track block depth (Snowflake Tasks/Procedures use BEGIN ... END;)
-        if "BEGIN" in line_upper:
-            depth += 1
-        
-        # Semicolon outside of a block marks completion
-        # OR if it's the specific END; of a block
-        if ";" in line_strip:
-            if depth == 0:
-                statements.append("\n".join(buffer).strip())
-                buffer = []
-            elif "END;" in line_upper or "END ;" in line_upper:
-                depth = max(0, depth - 1)
-                if depth == 0:
-                    statements.append("\n".join(buffer).strip())
-                    buffer = []
-
-    # Final buffer
-    if buffer:
-        statements.append("\n".join(buffer).strip())
-            
-    # 3. Execution
-    for stmt in statements:
-        if not stmt or len(stmt) < 5:
-            continue
-            
-        try:
-            session.sql(stmt).collect()
-        except Exception as e:
-            # Ignore harmless errors
-            if "already exists" in str(e).lower() or "does not exist" in str(e).lower():
-                pass
-            else:
-                print(f"⚠️  Error executing statement in {os.path.basename(file_path)}: {e}")
-                print(f"   >>> Statement causing error: {stmt[:250]}...")
+        for stmt, job in jobs:
+            try:
+                job.result()
+            except Exception as e:
+                _report_sql_error(file_path, stmt, e)
 
 def init_infra():
     print("=" * 60)
@@ -91,10 +164,15 @@ def init_infra():
         
         for sql_file in sql_files:
             file_path = os.path.join(sql_dir, sql_file)
+            if sql_file == 'advanced_analytics.sql':
+                # One-time migration: stockout_impact / budget_tracking used to be views
+                try:
+                    drop_legacy_views(session)
+                except Exception as e:
+                    print(f"⚠️  Could not check for legacy views: {e}")
             execute_sql_file(session, file_path)
             
         print("\n✅ Infrastructure initialization complete!")
-        session.close()
         
     except Exception as e:
         print(f"\n❌ Initialization failed: {e}")
@@ -4,7 +4,9 @@ Centralized configuration for email and Slack/Teams notifications
 """
 
 import os
-from typing import List, Dict
+import time
+from datetime import datetime
+from typing import Dict, Tuple
 
 # ============================================================================
 # Email Configuration (SMTP)
@@ -46,7 +48,13 @@ SLACK_CONFIG = {
     "enabled": os.getenv("SLACK_NOTIFICATIONS_ENABLED", "false").lower() == "true",
     
     # Webhook URL (Get from Slack: https://api.slack.com/messaging/webhooks)
+    # Comma-separated to post the same alert to several channels/workspaces
     "webhook_url": os.getenv("SLACK_WEBHOOK_URL", "https://hooks.slack.com/services/YOUR/WEBHOOK/URL"),
+    "webhook_urls": [
+        u.strip()
+        for u in os.getenv("SLACK_WEBHOOK_URL", "https://hooks.slack.com/services/YOUR/WEBHOOK/URL").split(",")
+        if u.strip()
+    ],
     
     # Channel Settings
     "channel": os.getenv("SLACK_CHANNEL", "#stock-alerts"),
@@ -89,30 +97,44 @@ NOTIFICATION_RULES = {
 # Helper Functions
 # ============================================================================
 
-def get_active_channels() -> List[str]:
-    """Get list of enabled notification channels."""
-    channels = []
-    if EMAIL_CONFIG["enabled"]:
-        channels.append("email")
-    if SLACK_CONFIG["enabled"]:
-        channels.append("slack")
-    return channels
+# Channel settings are read from the environment once, at import, so the
+# helpers below serve precomputed results
+_ACTIVE_CHANNELS = tuple(name for name, config in (("email", EMAIL_CONFIG), ("slack", SLACK_CONFIG)) if config["enabled"])
+
+# Alert levels each channel sends, as sets for constant-time lookups
+_ALERT_LEVELS_BY_CHANNEL = {
+    "email": frozenset(EMAIL_CONFIG["alert_levels"]),
+    "slack": frozenset(SLACK_CONFIG["alert_levels"]),
+}
+
+# Quiet-hours checks reuse the current hour for up to this many seconds
+QUIET_HOURS_CHECK_SECONDS = 60
+_cached_hour = -1
+_cached_hour_at = float("-inf")
+
+def get_active_channels() -> Tuple[str, ...]:
+    """Get the enabled notification channels."""
+    return _ACTIVE_CHANNELS
 
 def should_send_notification(alert_level: str, channel: str) -> bool:
     """Check if notification should be sent based on alert level and channel."""
-    if channel == "email":
-        return alert_level in EMAIL_CONFIG["alert_levels"]
-    elif channel == "slack":
-        return alert_level in SLACK_CONFIG["alert_levels"]
-    return False
+    return alert_level in _ALERT_LEVELS_BY_CHANNEL.get(channel, ())
+
+def _current_hour() -> int:
+    """Current local hour, re-read from the clock at most once a minute."""
+    global _cached_hour, _cached_hour_at
+    now = time.monotonic()
+    if now - _cached_hour_at > QUIET_HOURS_CHECK_SECONDS:
+        _cached_hour = datetime.now().hour
+        _cached_hour_at = now
+    return _cached_hour
 
 def is_quiet_hours() -> bool:
     """Check if current time is within quiet hours."""
     if not NOTIFICATION_RULES["quiet_hours_enabled"]:
         return False
     
-    from datetime import datetime
-    current_hour = datetime.now().hour
+    current_hour = _current_hour()
     start = NOTIFICATION_RULES["quiet_hours_start"]
     end = NOTIFICATION_RULES["quiet_hours_end"]
     
@@ -125,8 +147,7 @@ def is_quiet_hours() -> bool:
 # Configuration Validation
 # ============================================================================
 
-def validate_config() -> Dict[str, bool]:
-    """Validate notification configurations."""
+def _validate() -> Dict[str, bool]:
     validation = {
         "email": False,
         "slack": False,
@@ -140,11 +161,18 @@ def validate_config() -> Dict[str, bool]:
     
     # Validate Slack
     if SLACK_CONFIG["enabled"]:
-        if "YOUR/WEBHOOK/URL" not in SLACK_CONFIG["webhook_url"]:
+        urls = SLACK_CONFIG["webhook_urls"]
+        if urls and not any("YOUR/WEBHOOK/URL" in u for u in urls):
             validation["slack"] = True
     
     return validation
 
+_VALIDATION = _validate()
+
+def validate_config() -> Dict[str, bool]:
+    """Validate notification configurations (checked once, at import)."""
+    return dict(_VALIDATION)
+
 # ============================================================================
 # Print Configuration Status
 # ============================================================================
@@ -4,6 +4,17 @@ Force Refresh Dynamic Tables and Verify Data
 
 from config import get_snowflake_session
 
+# Refreshing a dynamic table also brings its upstream dynamic tables up to date,
+# so these can be refreshed concurrently
+DYNAMIC_TABLES = ('stock_stats', 'stock_health', 'reorder_recommendations')
+VERIFY_VIEWS = ('stock_risk', 'critical_alerts')
+
+# Row counts of every table and view checked after the refresh, as (NAME, ROW_COUNT) rows
+VERIFY_COUNTS_SQL = "\nUNION ALL\n".join(
+    f"SELECT '{name.upper()}' AS name, COUNT(*) AS row_count FROM {name}"
+    for name in DYNAMIC_TABLES + VERIFY_VIEWS
+)
+
 def refresh_and_verify():
     """Force refresh dynamic tables and verify data."""
     
@@ -25,53 +36,38 @@ def refresh_and_verify():
     for row in sample:
         print(f"   {row}")
     
-    # Force refresh dynamic tables
-    print("\n🔄 Force refreshing STOCK_STATS...")
-    try:
-        session.sql("ALTER DYNAMIC TABLE stock_stats REFRESH").collect()
-        print("   ✅ STOCK_STATS refreshed")
-    except Exception as e:
-        print(f"   ❌ Error: {e}")
-    
-    print("\n🔄 Force refreshing STOCK_HEALTH...")
-    try:
-        session.sql("ALTER DYNAMIC TABLE stock_health REFRESH").collect()
-        print("   ✅ STOCK_HEALTH refreshed")
-    except Exception as e:
-        print(f"   ❌ Error: {e}")
+    # Force refresh dynamic tables: all refreshes are submitted at once and
+    # awaited together instead of one round-trip each
+    print("\n🔄 Force refreshing dynamic tables...")
+    jobs = []
+    for table in DYNAMIC_TABLES:
+        try:
+            jobs.append((table, session.sql(f"ALTER DYNAMIC TABLE {table} REFRESH").collect_nowait()))
+        except Exception as e:
+            print(f"   ❌ {table.upper()}: {e}")
     
-    print("\n🔄 Force refreshing REORDER_RECOMMENDATIONS...")
-    try:
-        session.sql("ALTER DYNAMIC TABLE reorder_recommendations REFRESH").collect()
-        print("   ✅ REORDER_RECOMMENDATIONS refreshed")
-    except Exception as e:
-        print(f"   ❌ Error: {e}")
+    for table, job in jobs:
+        try:
+            job.result()
+            print(f"   ✅ {table.upper()} refreshed")
+        except Exception as e:
+            print(f"   ❌ {table.upper()}: {e}")
     
-    # Wait a moment for refresh
-    import time
-    print("\n⏳ Waiting 5 seconds for refresh to complete...")
-    time.sleep(5)
+    # The refresh jobs have completed once their results are in, so the
+    # counts can be read straight away - all in one query
+    counts = {row['NAME']: row['ROW_COUNT'] for row in session.sql(VERIFY_COUNTS_SQL).collect()}
+    stats_count = counts['STOCK_STATS']
+    risk_count = counts['STOCK_RISK']
     
     # Verify counts
     print("\n📊 Verifying dynamic tables...")
-    
-    stats_count = session.sql("SELECT COUNT(*) as count FROM stock_stats").collect()[0]['COUNT']
-    print(f"   STOCK_STATS: {stats_count} rows")
-    
-    health_count = session.sql("SELECT COUNT(*) as count FROM stock_health").collect()[0]['COUNT']
-    print(f"   STOCK_HEALTH: {health_count} rows")
-    
-    reorder_count = session.sql("SELECT COUNT(*) as count FROM reorder_recommendations").collect()[0]['COUNT']
-    print(f"   REORDER_RECOMMENDATIONS: {reorder_count} rows")
+    for table in DYNAMIC_TABLES:
+        print(f"   {table.upper()}: {counts[table.upper()]} rows")
     
     # Check views
     print("\n📊 Checking views...")
-    
-    risk_count = session.sql("SELECT COUNT(*) as count FROM stock_risk").collect()[0]['COUNT']
-    print(f"   STOCK_RISK: {risk_count} rows")
-    
-    alerts_count = session.sql("SELECT COUNT(*) as count FROM critical_alerts").collect()[0]['COUNT']
-    print(f"   CRITICAL_ALERTS: {alerts_count} rows")
+    for view in VERIFY_VIEWS:
+        print(f"   {view.upper()}: {counts[view.upper()]} rows")
     
     # If still 0, try querying the base table directly
     if stats_count == 0:
@@ -120,8 +116,6 @@ def refresh_and_verify():
         print("   1. Wait a few minutes for auto-refresh (based on TARGET_LAG)")
         print("   2. Check if warehouse is running")
         print("   3. Manually create regular tables instead of dynamic tables")
-    
-    session.close()
 
 if __name__ == "__main__":
     refresh_and_verify()
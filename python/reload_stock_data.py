@@ -6,9 +6,155 @@ Clears and reloads stock_raw table with updated data
 import sys
 import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from config import get_snowflake_session
 
 
+# Table expects: location, item, current_stock, issued_qty, received_qty, last_updated_date
+RAW_STOCK_COLUMNS = ['location', 'item', 'current_stock', 'issued_qty', 'received_qty', 'last_updated_date']
+# Arrow types of RAW_STOCK_COLUMNS, in the same order
+RAW_STOCK_ARROW_TYPES = [pa.string(), pa.string(), pa.int32(), pa.int32(), pa.int32(), pa.date32()]
+# Old CSV format column -> RAW_STOCK column
+OLD_FORMAT_COLUMNS = {
+    'location': 'location',
+    'item': 'item',
+    'closing_stock': 'current_stock',
+    'issued': 'issued_qty',
+    'received': 'received_qty',
+    'record_date': 'last_updated_date',
+}
+
+# Post-load checks computed in one scan of RAW_STOCK
+RAW_STOCK_VALIDATION_SQL = """
+SELECT
+    COUNT(*) AS total_rows,
+    COUNT_IF(location IS NULL) AS null_location,
+    COUNT_IF(item IS NULL) AS null_item,
+    COUNT_IF(current_stock IS NULL) AS null_stock,
+    COUNT_IF(current_stock < 0) AS negative_stock,
+    MIN(last_updated_date) AS min_date,
+    MAX(last_updated_date) AS max_date,
+    COUNT(DISTINCT last_updated_date) AS unique_dates
+FROM RAW_STOCK
+"""
+
+
+def csv_source_columns(header):
+    """CSV columns holding RAW_STOCK's columns, in RAW_STOCK order."""
+    if 'current_stock' in header:
+        # New format - already matches table structure
+        print("✅ CSV already matches table structure")
+        return RAW_STOCK_COLUMNS
+    # Old format - needs mapping
+    print("🔄 Converting from old CSV format...")
+    return list(OLD_FORMAT_COLUMNS)
+
+
+def read_stock_csv(csv_path):
+    """
+    Read the stock CSV into RAW_STOCK's column layout.
+    pyarrow's CSV reader parses only the needed columns, straight into
+    RAW_STOCK_ARROW_TYPES (dates as date32, so no per-row date parsing),
+    and the frame keeps those Arrow-backed columns for write_pandas.
+    """
+    columns = csv_source_columns(pd.read_csv(csv_path, nrows=0).columns)
+    
+    table = pacsv.read_csv(
+        csv_path,
+        convert_options=pacsv.ConvertOptions(
+            column_types=dict(zip(columns, RAW_STOCK_ARROW_TYPES)),
+            include_columns=columns
+        )
+    )
+    return table.rename_columns(RAW_STOCK_COLUMNS).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def copy_csv_file(session, csv_path, table_name):
+    """
+    PUT the CSV file as-is to the table's stage and COPY INTO table_name,
+    picking the needed fields by position so both CSV formats load without
+    a pandas round-trip. The staged file is purged once loaded.
+    """
+    header = list(pd.read_csv(csv_path, nrows=0).columns)
+    positions = [header.index(c) + 1 for c in csv_source_columns(header)]
+    fields = ", ".join(f"${i}" for i in positions)
+    
+    stage = f"@%{table_name}"
+    session.file.put(csv_path, stage, auto_compress=True, overwrite=True, parallel=8)
+    
+    session.sql(f"""
+        COPY INTO {table_name} ({", ".join(RAW_STOCK_COLUMNS)})
+        FROM (SELECT {fields} FROM {stage})
+        FILES = ('{os.path.basename(csv_path)}.gz')
+        FILE_FORMAT = (TYPE = CSV SKIP_HEADER = 1 FIELD_OPTIONALLY_ENCLOSED_BY = '"')
+        ON_ERROR = 'ABORT_STATEMENT'
+        PURGE = TRUE
+    """).collect()
+
+
+def insert_stock_rows(session, df, table_name, chunk_size=500):
+    """
+    Append df to table_name with multi-row INSERT statements and bound
+    values. Slower than a staged COPY, but needs no PUT, so it still works
+    where file staging is blocked.
+    """
+    columns = ", ".join(df.columns)
+    row_sql = "(" + ", ".join("?" * len(df.columns)) + ")"
+    
+    total_rows = len(df)
+    for start in range(0, total_rows, chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        # Missing values bind as NULL
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        params = [value for row in chunk.itertuples(index=False, name=None) for value in row]
+        session.sql(
+            f"INSERT INTO {table_name} ({columns}) VALUES {', '.join([row_sql] * len(chunk))}",
+            params=params
+        ).collect()
+        print(f"   ✅ Processed {start + len(chunk)}/{total_rows} rows...")
+
+
+def write_stock_frame(session, df, table_name):
+    """
+    Bulk-load df into table_name with write_pandas, which stages the frame
+    as compressed Parquet and runs a single COPY. If the Snowpark wrapper
+    fails, the connector's write_pandas is tried on the same connection;
+    both stage files with PUT, so if that fails too the rows are inserted
+    directly (to avoid PUT command errors).
+    """
+    try:
+        session.write_pandas(
+            df,
+            table_name,
+            auto_create_table=False,
+            overwrite=True,
+            quote_identifiers=False,
+            chunk_size=16000,
+            use_logical_type=True
+        )
+        return
+    except Exception as e:
+        print(f"⚠️  Snowpark write_pandas failed, retrying with the connector: {e}")
+    
+    try:
+        from snowflake.connector.pandas_tools import write_pandas
+        write_pandas(
+            session.connection,
+            df,
+            table_name,
+            auto_create_table=False,
+            overwrite=True,
+            quote_identifiers=False,
+            chunk_size=16000,
+            use_logical_type=True
+        )
+    except Exception as e:
+        print(f"⚠️  write_pandas failed, inserting rows without staging: {e}")
+        session.sql(f"TRUNCATE TABLE {table_name}").collect()
+        insert_stock_rows(session, df, table_name)
+
+
 def reload_stock_data():
     """
     Clear and reload stock_raw table with fresh data.
@@ -40,7 +186,6 @@ def reload_stock_data():
                 print("   1. Snowflake Web UI (Worksheets)")
                 print("   2. VS Code Snowflake extension")
                 print("   3. SnowSQL CLI")
-                session.close()
                 return
             
             print("✅ Table exists")
@@ -66,34 +211,6 @@ def reload_stock_data():
         if not os.path.exists(csv_path):
             raise FileNotFoundError(f"CSV file not found: {csv_path}")
         
-        # Read CSV
-        print(f"\n📂 Reading {csv_path}...")
-        df = pd.read_csv(csv_path)
-        print(f"📊 Loaded {len(df)} rows from CSV")
-        
-        # Check CSV format and map columns accordingly
-        # Table expects: location, item, current_stock, issued_qty, received_qty, last_updated_date
-        print("\n🔄 Mapping columns to match table structure...")
-        
-        if 'current_stock' in df.columns:
-            # New format - already matches table structure
-            print("✅ CSV already matches table structure")
-            df_mapped = df[['location', 'item', 'current_stock', 'issued_qty', 'received_qty', 'last_updated_date']].copy()
-            df_mapped['last_updated_date'] = pd.to_datetime(df_mapped['last_updated_date']).dt.date
-        else:
-            # Old format - needs mapping
-            print("🔄 Converting from old CSV format...")
-            df_mapped = pd.DataFrame({
-                'location': df['location'],
-                'item': df['item'],
-                'current_stock': df['closing_stock'],
-                'issued_qty': df['issued'],
-                'received_qty': df['received'],
-                'last_updated_date': pd.to_datetime(df['record_date']).dt.date
-            })
-        
-        print(f"✅ Mapped {len(df_mapped)} rows")
-        
         # Clear existing data
         print("\n🗑️  Clearing existing data from RAW_STOCK...")
         try:
@@ -103,41 +220,34 @@ def reload_stock_data():
             print(f"⚠️  Could not truncate table: {e}")
             print("   Table might be empty, continuing...")
         
-        # Write to Snowflake using chunked inserts (to avoid PUT command errors)
-        print(f"\n📤 Loading {len(df_mapped)} rows into RAW_STOCK using chunked inserts...")
+        # Write to Snowflake: the CSV file itself is staged and copied in;
+        # if that fails it is read with pandas and loaded from the DataFrame
+        print(f"\n📤 Loading {csv_path} into RAW_STOCK...")
         
-        # Function to batch insert data
-        def batch_insert(df, table_name, chunk_size=500):
-            total_rows = len(df)
-            for start in range(0, total_rows, chunk_size):
-                end = min(start + chunk_size, total_rows)
-                chunk = df.iloc[start:end]
-                
-                # Convert chunk to values list for SQL
-                values_list = []
-                for _, row in chunk.iterrows():
-                    # Format last_updated_date carefully
-                    date_val = row['last_updated_date']
-                    date_str = date_val.strftime('%Y-%m-%d') if hasattr(date_val, 'strftime') else str(date_val)
-                    
-                    # Escape single quotes for SQL safely
-                    safe_location = str(row['location']).replace("'", "''")
-                    safe_item = str(row['item']).replace("'", "''")
-                    
-                    val = f"('{safe_location}', '{safe_item}', {row['current_stock']}, {row['issued_qty']}, {row['received_qty']}, '{date_str}')"
-                    values_list.append(val)
-                
-                sql = f'INSERT INTO {table_name} (location, item, current_stock, issued_qty, received_qty, last_updated_date) VALUES {", ".join(values_list)}'
-                session.sql(sql).collect()
-                print(f"   ✅ Processed {end}/{total_rows} rows...")
-
-        batch_insert(df_mapped, 'RAW_STOCK')
+        try:
+            copy_csv_file(session, csv_path, 'RAW_STOCK')
+            loaded = True
+            print("✅ Data loaded successfully using CSV COPY INTO")
+        except Exception as e:
+            loaded = False
+            print(f"⚠️  CSV upload failed, loading through pandas instead: {e}")
         
-        print("✅ Data loaded successfully using batch inserts")
+        if not loaded:
+            # Read CSV and map columns to match table structure
+            print(f"\n📂 Reading {csv_path}...")
+            df_mapped = read_stock_csv(csv_path)
+            print(f"✅ Mapped {len(df_mapped)} rows")
+            
+            write_stock_frame(session, df_mapped, 'RAW_STOCK')
+            print("✅ Data loaded successfully from the DataFrame")
         
-        # Verify
-        count = session.table("RAW_STOCK").count()
-        print(f"\n📊 Total rows in RAW_STOCK: {count}")
+        # Verify (row count and data checks in a single query)
+        checks = session.sql(RAW_STOCK_VALIDATION_SQL).collect()[0]
+        print(f"\n📊 Total rows in RAW_STOCK: {checks['TOTAL_ROWS']}")
+        print(f"   Dates: {checks['MIN_DATE']} to {checks['MAX_DATE']} ({checks['UNIQUE_DATES']} days)")
+        nulls = checks['NULL_LOCATION'] + checks['NULL_ITEM'] + checks['NULL_STOCK']
+        if nulls or checks['NEGATIVE_STOCK']:
+            print(f"⚠️  Data issues: {nulls} missing values, {checks['NEGATIVE_STOCK']} negative stock rows")
         
         # Show sample data
         print("\n📋 Sample data:")
@@ -153,8 +263,6 @@ def reload_stock_data():
             print(f"⚠️  Note: {e}")
             print("   Dynamic tables will auto-refresh based on TARGET_LAG setting")
         
-        # Close session
-        session.close()
         print("\n✅ Data reload completed successfully!")
         print("\n💡 Tip: Dynamic tables will auto-refresh within 1 hour")
         print("   Check the dashboard to see updated alerts")
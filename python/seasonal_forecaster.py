@@ -11,6 +11,67 @@ from datetime import datetime, timedelta
 from config import get_snowflake_session
 
 
+# Weekly and monthly usage statistics in one scan: rows with IS_WEEKLY are per
+# (location, item, day of week), the rest per (location, item, month)
+PATTERN_STATS_SQL = """
+WITH base AS (
+    SELECT
+        location,
+        item,
+        DAYOFWEEK(last_updated_date) as day_of_week,
+        MONTH(last_updated_date) as month_num,
+        issued_qty
+    FROM RAW_STOCK
+)
+SELECT
+    location,
+    item,
+    day_of_week,
+    month_num,
+    GROUPING(day_of_week) = 0 as is_weekly,
+    AVG(issued_qty) as avg_usage,
+    STDDEV(issued_qty) as stddev_usage,
+    COUNT(*) as data_points
+FROM base
+GROUP BY GROUPING SETS ((location, item, day_of_week), (location, item, month_num))
+ORDER BY location, item, day_of_week, month_num
+"""
+
+# Snowflake DAYOFWEEK (0 = Sunday) and MONTH numbers to names
+DAY_NAMES = {
+    0: 'Sunday', 1: 'Monday', 2: 'Tuesday', 3: 'Wednesday',
+    4: 'Thursday', 5: 'Friday', 6: 'Saturday',
+}
+MONTH_NAMES = {
+    1: 'January', 2: 'February', 3: 'March', 4: 'April', 5: 'May', 6: 'June',
+    7: 'July', 8: 'August', 9: 'September', 10: 'October', 11: 'November', 12: 'December',
+}
+
+# Full history for batch forecasting, date-ordered within each item
+SEASONAL_HISTORY_SQL = """
+SELECT
+    location,
+    item,
+    last_updated_date as record_date,
+    issued_qty as issued
+FROM RAW_STOCK
+ORDER BY location, item, last_updated_date
+"""
+
+# Single item's history; placeholders are (location, item)
+ITEM_HISTORY_SQL = """
+SELECT
+    location,
+    item,
+    last_updated_date as record_date,
+    issued_qty as issued
+FROM RAW_STOCK
+WHERE location = ?
+AND item = ?
+ORDER BY last_updated_date
+"""
+
+
 class SeasonalForecaster:
     """
     Identifies seasonal patterns and creates forecasts accounting for seasonality.
@@ -19,6 +80,20 @@ class SeasonalForecaster:
     
     def __init__(self, session: Session):
         self.session = session
+        self._pattern_stats_df = None  # Filled on first use by _pattern_stats()
+    
+    def _pattern_stats(self) -> pd.DataFrame:
+        """
+        Usage statistics per (location, item, day of week) and per
+        (location, item, month), read in a single scan of RAW_STOCK
+        (PATTERN_STATS_SQL) and shared by the pattern analyses below.
+        """
+        if self._pattern_stats_df is None:
+            stats = self.session.sql(PATTERN_STATS_SQL).to_pandas()
+            for column in ('AVG_USAGE', 'STDDEV_USAGE'):
+                stats[column] = stats[column].astype('float64')
+            self._pattern_stats_df = stats
+        return self._pattern_stats_df
     
     def analyze_weekly_patterns(self):
         """
@@ -26,35 +101,22 @@ class SeasonalForecaster:
         """
         print("📅 Analyzing weekly patterns...")
         
-        weekly_query = """
-        SELECT
-            location,
-            item,
-            DAYOFWEEK(last_updated_date) as day_of_week,
-            CASE DAYOFWEEK(last_updated_date)
-                WHEN 0 THEN 'Sunday'
-                WHEN 1 THEN 'Monday'
-                WHEN 2 THEN 'Tuesday'
-                WHEN 3 THEN 'Wednesday'
-                WHEN 4 THEN 'Thursday'
-                WHEN 5 THEN 'Friday'
-                WHEN 6 THEN 'Saturday'
-            END as day_name,
-            AVG(issued_qty) as avg_usage,
-            STDDEV(issued_qty) as stddev_usage,
-            COUNT(*) as data_points,
-            CASE
-                WHEN DAYOFWEEK(last_updated_date) IN (0, 6) THEN 'Weekend'
-                ELSE 'Weekday'
-            END as day_type
-        FROM RAW_STOCK
-        GROUP BY location, item, day_of_week, day_name, day_type
-        ORDER BY location, item, day_of_week
-        """
+        stats = self._pattern_stats()
+        weekly = stats[stats['IS_WEEKLY']]
         
-        results = self.session.sql(weekly_query).to_pandas()
-        
-        if not results.empty:
+        if not weekly.empty:
+            day_of_week = weekly['DAY_OF_WEEK'].astype('int64')
+            results = pd.DataFrame({
+                'LOCATION': weekly['LOCATION'],
+                'ITEM': weekly['ITEM'],
+                'DAY_OF_WEEK': day_of_week,
+                'DAY_NAME': day_of_week.map(DAY_NAMES),
+                'AVG_USAGE': weekly['AVG_USAGE'],
+                'STDDEV_USAGE': weekly['STDDEV_USAGE'],
+                'DATA_POINTS': weekly['DATA_POINTS'],
+                'DAY_TYPE': np.where(day_of_week.isin([0, 6]), 'Weekend', 'Weekday'),
+            }).reset_index(drop=True)
+            
             print(f"✅ Analyzed weekly patterns for {len(results)} combinations")
             
             # Show sample data
@@ -68,40 +130,28 @@ class SeasonalForecaster:
             print("⚠️ No weekly pattern data available")
             return pd.DataFrame()
     
+    def _monthly_stats(self) -> pd.DataFrame:
+        """Per (location, item, month) rows of the shared pattern statistics."""
+        stats = self._pattern_stats()
+        monthly = stats[~stats['IS_WEEKLY']]
+        month_num = monthly['MONTH_NUM'].astype('int64')
+        return pd.DataFrame({
+            'LOCATION': monthly['LOCATION'],
+            'ITEM': monthly['ITEM'],
+            'MONTH_NUM': month_num,
+            'MONTH_NAME': month_num.map(MONTH_NAMES),
+            'AVG_USAGE': monthly['AVG_USAGE'],
+            'STDDEV_USAGE': monthly['STDDEV_USAGE'],
+            'DATA_POINTS': monthly['DATA_POINTS'],
+        }).reset_index(drop=True)
+    
     def analyze_monthly_patterns(self):
         """
         Analyze usage patterns by month.
         """
         print("📆 Analyzing monthly patterns...")
         
-        monthly_query = """
-        SELECT
-            location,
-            item,
-            MONTH(last_updated_date) as month_num,
-            CASE MONTH(last_updated_date)
-                WHEN 1 THEN 'January'
-                WHEN 2 THEN 'February'
-                WHEN 3 THEN 'March'
-                WHEN 4 THEN 'April'
-                WHEN 5 THEN 'May'
-                WHEN 6 THEN 'June'
-                WHEN 7 THEN 'July'
-                WHEN 8 THEN 'August'
-                WHEN 9 THEN 'September'
-                WHEN 10 THEN 'October'
-                WHEN 11 THEN 'November'
-                WHEN 12 THEN 'December'
-            END as month_name,
-            AVG(issued_qty) as avg_usage,
-            STDDEV(issued_qty) as stddev_usage,
-            COUNT(*) as data_points
-        FROM RAW_STOCK
-        GROUP BY location, item, month_num, month_name
-        ORDER BY location, item, month_num
-        """
-        
-        results = self.session.sql(monthly_query).to_pandas()
+        results = self._monthly_stats()
         
         if not results.empty:
             print(f"✅ Analyzed monthly patterns for {len(results)} combinations")
@@ -113,45 +163,27 @@ class SeasonalForecaster:
     def detect_seasonal_trends(self):
         """
         Detect if items have significant seasonal trends.
+        Seasonal variation is the spread of an item's monthly averages.
         """
         print("🔍 Detecting seasonal trends...")
         
-        trend_query = """
-        WITH monthly_stats AS (
-            SELECT
-                location,
-                item,
-                MONTH(last_updated_date) as month_num,
-                AVG(issued_qty) as avg_usage
-            FROM RAW_STOCK
-            GROUP BY location, item, month_num
-        ),
-        overall_stats AS (
-            SELECT
-                location,
-                item,
-                AVG(avg_usage) as overall_avg,
-                STDDEV(avg_usage) as seasonal_variation
-            FROM monthly_stats
-            GROUP BY location, item
-        )
-        SELECT
-            location,
-            item,
-            overall_avg,
-            seasonal_variation,
-            CASE
-                WHEN seasonal_variation > (overall_avg * 0.3) THEN 'HIGH_SEASONALITY'
-                WHEN seasonal_variation > (overall_avg * 0.15) THEN 'MODERATE_SEASONALITY'
-                ELSE 'LOW_SEASONALITY'
-            END as seasonality_level,
-            ROUND((seasonal_variation / NULLIF(overall_avg, 0)) * 100, 2) as coefficient_of_variation
-        FROM overall_stats
-        WHERE overall_avg > 0
-        ORDER BY coefficient_of_variation DESC
-        """
+        monthly = self._monthly_stats()
+        overall = monthly.groupby(['LOCATION', 'ITEM'])['AVG_USAGE'].agg(
+            OVERALL_AVG='mean',
+            SEASONAL_VARIATION='std'
+        ).reset_index()
+        overall = overall[overall['OVERALL_AVG'] > 0]
         
-        results = self.session.sql(trend_query).to_pandas()
+        overall_avg = overall['OVERALL_AVG']
+        variation = overall['SEASONAL_VARIATION']
+        results = overall.assign(
+            SEASONALITY_LEVEL=np.select(
+                [variation > overall_avg * 0.3, variation > overall_avg * 0.15],
+                ['HIGH_SEASONALITY', 'MODERATE_SEASONALITY'],
+                'LOW_SEASONALITY'
+            ),
+            COEFFICIENT_OF_VARIATION=(variation / overall_avg * 100).round(2)
+        ).sort_values('COEFFICIENT_OF_VARIATION', ascending=False, na_position='first').reset_index(drop=True)
         
         if not results.empty:
             print(f"✅ Detected seasonality for {len(results)} items")
@@ -177,60 +209,14 @@ class SeasonalForecaster:
         """
         print(f"🎯 Creating seasonal forecast for {item} at {location}...")
         
-        # Get historical data with day of week
-        historical_query = f"""
-        SELECT
-            last_updated_date as record_date,
-            issued_qty as issued,
-            DAYOFWEEK(last_updated_date) as day_of_week,
-            MONTH(last_updated_date) as month_num
-        FROM RAW_STOCK
-        WHERE location = '{location}'
-        AND item = '{item}'
-        ORDER BY last_updated_date
-        """
-        
-        historical = self.session.sql(historical_query).to_pandas()
+        # Get historical data (bound parameters: one query text for every item)
+        historical = self.session.sql(ITEM_HISTORY_SQL, params=[location, item]).to_pandas()
         
         if historical.empty:
             print("⚠️ No historical data available")
             return None
         
-        # Calculate seasonal factors by day of week
-        seasonal_factors = historical.groupby('DAY_OF_WEEK')['ISSUED'].mean()
-        overall_avg = historical['ISSUED'].mean()
-        
-        # Normalize seasonal factors
-        seasonal_factors = seasonal_factors / overall_avg
-        
-        # Create forecast dates
-        last_date = historical['RECORD_DATE'].max()
-        forecast_dates = pd.date_range(
-            start=last_date + timedelta(days=1),
-            periods=forecast_days,
-            freq='D'
-        )
-        
-        # Generate forecasts with seasonal adjustment
-        forecasts = []
-        base_forecast = historical['ISSUED'].tail(7).mean()  # Use recent average
-        
-        for date in forecast_dates:
-            day_of_week = date.dayofweek
-            seasonal_factor = seasonal_factors.get(day_of_week, 1.0)
-            
-            forecasted_value = base_forecast * seasonal_factor
-            
-            forecasts.append({
-                'location': location,
-                'item': item,
-                'forecast_date': date,
-                'forecasted_usage': round(forecasted_value, 2),
-                'seasonal_factor': round(seasonal_factor, 2),
-                'base_forecast': round(base_forecast, 2)
-            })
-        
-        forecast_df = pd.DataFrame(forecasts)
+        forecast_df = _seasonal_forecasts(historical, forecast_days)
         print(f"✅ Created {len(forecast_df)}-day seasonal forecast")
         
         return forecast_df
@@ -238,32 +224,21 @@ class SeasonalForecaster:
     def batch_seasonal_forecast(self, forecast_days: int = 7):
         """
         Create seasonal forecasts for all items.
+        The whole history is pulled in one query and every item is forecast
+        in the same vectorized pass.
         """
         print("🚀 Starting batch seasonal forecasting...")
         
-        # Get all location-item combinations
-        combinations = self.session.sql("""
-            SELECT DISTINCT location, item
-            FROM RAW_STOCK
-        """).collect()
-        
-        all_forecasts = []
+        historical = self.session.sql(SEASONAL_HISTORY_SQL).to_pandas()
         
-        for row in combinations:
-            location = row['LOCATION']
-            item = row['ITEM']
-            
-            forecast = self.create_seasonal_forecast(location, item, forecast_days)
-            if forecast is not None:
-                all_forecasts.append(forecast)
-        
-        if all_forecasts:
-            combined = pd.concat(all_forecasts, ignore_index=True)
-            print(f"\n✅ Batch seasonal forecasting complete: {len(all_forecasts)} items")
-            return combined
-        else:
+        if historical.empty:
             print("⚠️ No forecasts generated")
             return None
+        
+        combined = _seasonal_forecasts(historical, forecast_days)
+        item_count = len(combined) // forecast_days if forecast_days else 0
+        print(f"\n✅ Batch seasonal forecasting complete: {item_count} items")
+        return combined
     
     def save_seasonal_forecasts(self, forecasts_df: pd.DataFrame):
         """
@@ -283,35 +258,19 @@ class SeasonalForecaster:
                 )
             """).collect()
             
-            # Save forecasts using chunked inserts (to avoid PUT command errors)
-            print(f"📤 Saving {len(forecasts_df)} forecasts using chunked inserts...")
-            
-            def batch_insert_forecasts(df, table_name, chunk_size=100):
-                total_rows = len(df)
-                for start in range(0, total_rows, chunk_size):
-                    end = min(start + chunk_size, total_rows)
-                    chunk = df.iloc[start:end]
-                    
-                    values_list = []
-                    for _, row in chunk.iterrows():
-                        date_val = row['forecast_date']
-                        date_str = date_val.strftime('%Y-%m-%d') if hasattr(date_val, 'strftime') else str(date_val)
-                        
-                        # Escape quotes
-                        safe_loc = str(row['location']).replace("'", "''")
-                        safe_item = str(row['item']).replace("'", "''")
-                        
-                        val = f"('{safe_loc}', '{safe_item}', '{date_str}', {row['forecasted_usage']}, {row['seasonal_factor']}, {row['base_forecast']})"
-                        values_list.append(val)
-                    
-                    sql = f"INSERT INTO {table_name} (location, item, forecast_date, forecasted_usage, seasonal_factor, base_forecast) VALUES {', '.join(values_list)}"
-                    self.session.sql(sql).collect()
-                    print(f"   ✅ Processed {end}/{total_rows} forecasts...")
-
-            # Clear existing forecasts first for a clean run if desired (or it handles overwrite:True)
-            self.session.sql("TRUNCATE TABLE IF EXISTS seasonal_forecasts").collect()
-            
-            batch_insert_forecasts(forecasts_df, "seasonal_forecasts")
+            # Replace the previous forecasts in one staged Parquet upload
+            print(f"📤 Saving {len(forecasts_df)} forecasts...")
+            self.session.write_pandas(
+                forecasts_df,
+                "SEASONAL_FORECASTS",
+                auto_create_table=False,
+                overwrite=True,
+                chunk_size=50_000,
+                parallel=8,
+                compression="snappy",
+                use_logical_type=True,
+                quote_identifiers=False
+            )
             
             print(f"✅ Saved {len(forecasts_df)} seasonal forecasts to Snowflake")
             
@@ -319,6 +278,55 @@ class SeasonalForecaster:
             print(f"❌ Error saving forecasts: {e}")
 
 
+def _seasonal_forecasts(historical: pd.DataFrame, forecast_days: int) -> pd.DataFrame:
+    """
+    Seasonal forecasts for every (location, item) in `historical`, which has
+    Snowflake's uppercase LOCATION, ITEM, RECORD_DATE and ISSUED columns and
+    is date-ordered within each item.
+    
+    Each forecast day is the item's recent average (last 7 records) scaled by
+    its day-of-week factor: that weekday's average usage over the item's
+    overall average, or 1.0 for weekdays with no history.
+    """
+    keys = ['LOCATION', 'ITEM']
+    historical = historical.assign(
+        RECORD_DATE=pd.to_datetime(historical['RECORD_DATE']),
+        ISSUED=historical['ISSUED'].astype('float64')
+    )
+    historical['DAY_OF_WEEK'] = historical['RECORD_DATE'].dt.dayofweek
+    
+    by_item = historical.groupby(keys)
+    summary = pd.DataFrame({
+        'overall_avg': by_item['ISSUED'].mean(),
+        'base_forecast': historical.groupby(keys).tail(7).groupby(keys)['ISSUED'].mean(),  # Use recent average
+        'last_date': by_item['RECORD_DATE'].max(),
+    }).reset_index()
+    
+    # Normalized seasonal factors by day of week
+    weekday_avg = historical.groupby(keys + ['DAY_OF_WEEK'])['ISSUED'].mean().reset_index()
+    weekday_avg = weekday_avg.merge(summary[keys + ['overall_avg']], on=keys)
+    weekday_avg['seasonal_factor'] = weekday_avg['ISSUED'] / weekday_avg['overall_avg']
+    
+    # Forecast grid: the forecast_days days after each item's last record
+    grid = summary.loc[summary.index.repeat(forecast_days)].reset_index(drop=True)
+    offsets = np.tile(np.arange(1, forecast_days + 1), len(summary))
+    grid['forecast_date'] = grid['last_date'] + pd.to_timedelta(offsets, unit='D')
+    grid['DAY_OF_WEEK'] = grid['forecast_date'].dt.dayofweek
+    grid = grid.merge(weekday_avg[keys + ['DAY_OF_WEEK', 'seasonal_factor']], on=keys + ['DAY_OF_WEEK'], how='left')
+    seasonal_factor = grid['seasonal_factor'].fillna(1.0)
+    
+    # Generate forecasts with seasonal adjustment; the two-decimal values are
+    # stored as float32, which is plenty for the NUMBER(10,2)/(5,2) columns
+    return pd.DataFrame({
+        'location': grid['LOCATION'],
+        'item': grid['ITEM'],
+        'forecast_date': grid['forecast_date'],
+        'forecasted_usage': (grid['base_forecast'] * seasonal_factor).round(2).astype('float32'),
+        'seasonal_factor': seasonal_factor.round(2).astype('float32'),
+        'base_forecast': grid['base_forecast'].round(2).astype('float32'),
+    })
+
+
 def run_seasonal_analysis():
     """
     Main function to run seasonal pattern analysis and forecasting.
@@ -348,7 +356,6 @@ def run_seasonal_analysis():
             print("\n📈 Sample Forecasts:")
             print(forecasts.head(10))
         
-        session.close()
         print("\n✅ Seasonal analysis completed")
         
     except Exception as e:
@@ -1,18 +1,35 @@
 import os
+import threading
 import requests
-import json
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Slack's Block Kit limit per message
+SLACK_MAX_BLOCKS = 50
+SLACK_ALERT_COLUMNS = ['LOCATION', 'ITEM', 'STOCK_STATUS', 'CURRENT_STOCK', 'DAYS_UNTIL_STOCKOUT']
+
+# One HTTP session per thread so repeated webhook posts reuse the TCP/TLS
+# connection; requests.Session is not safe to share across worker threads
+_local = threading.local()
+
+def _http_session() -> requests.Session:
+    """Return this thread's pooled requests session."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
 class SlackNotifier:
     """Sends Slack notifications for stock alerts using Webhooks."""
     
     def __init__(self):
         self.enabled = os.getenv("SLACK_NOTIFICATIONS_ENABLED", "false").lower() == "true"
-        self.webhook_url = os.getenv("SLACK_WEBHOOK_URL")
+        # Comma-separated to route the same alert to several channels/workspaces
+        self.webhook_urls = [u.strip() for u in os.getenv("SLACK_WEBHOOK_URL", "").split(",") if u.strip()]
         self.channel = os.getenv("SLACK_CHANNEL", "#stock-alerts")
         self.username = os.getenv("SLACK_USERNAME", "StockPulse Bot")
         self.icon = os.getenv("SLACK_ICON", ":hospital:")
@@ -23,7 +40,7 @@ class SlackNotifier:
         if not self.enabled:
             return
 
-        if not self.webhook_url:
+        if not self.webhook_urls:
             print("⚠️ Slack: Webhook URL is missing in .env")
             return
             
@@ -63,18 +80,10 @@ class SlackNotifier:
             {"type": "divider"}
         ]
         
-        for _, alert in critical_items.iterrows():
-            icon = "🔴" if alert['STOCK_STATUS'] == 'OUT_OF_STOCK' else "🟠"
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"{icon} *{alert['ITEM']}* at *{alert['LOCATION']}*\n"
-                            f"• Status: `{alert['STOCK_STATUS']}`\n"
-                            f"• Stock Level: `{alert['CURRENT_STOCK']:.0f} units`\n"
-                            f"• Est. Stockout: `{alert['DAYS_UNTIL_STOCKOUT']:.1f} days`"
-                }
-            })
+        blocks.extend(
+            _row_to_block(row)
+            for row in critical_items[SLACK_ALERT_COLUMNS].itertuples(index=False)
+        )
             
         blocks.append({"type": "divider"})
         blocks.append({
@@ -87,9 +96,23 @@ class SlackNotifier:
             ]
         })
         
-        self._send(blocks)
+        # Slack rejects messages with more than 50 blocks, so large alert sets
+        # go out as consecutive messages over one pooled connection
+        chunks = [blocks[start:start + SLACK_MAX_BLOCKS] for start in range(0, len(blocks), SLACK_MAX_BLOCKS)]
 
-    def _send(self, blocks):
+        def deliver(url):
+            for chunk in chunks:
+                self._send(url, chunk)
+
+        if len(self.webhook_urls) == 1:
+            deliver(self.webhook_urls[0])
+            return
+
+        # Each webhook keeps its chunks in order; distinct webhooks post concurrently
+        with ThreadPoolExecutor(max_workers=len(self.webhook_urls)) as executor:
+            list(executor.map(deliver, self.webhook_urls))
+
+    def _send(self, webhook_url, blocks):
         """POST the blocks to Slack Webhook."""
         payload = {
             "channel": self.channel,
@@ -99,11 +122,7 @@ class SlackNotifier:
         }
         
         try:
-            response = requests.post(
-                self.webhook_url, 
-                data=json.dumps(payload),
-                headers={'Content-Type': 'application/json'}
-            )
+            response = _http_session().post(webhook_url, json=payload)
             if response.status_code != 200:
                 print(f"❌ Slack API Error: {response.text}")
             else:
@@ -111,15 +130,26 @@ class SlackNotifier:
         except Exception as e:
             print(f"❌ Failed to reach Slack: {e}")
 
+
+def _row_to_block(alert) -> dict:
+    """Build the Slack section block for a single alert row."""
+    icon = "🔴" if alert.STOCK_STATUS == 'OUT_OF_STOCK' else "🟠"
+    return {
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": f"{icon} *{alert.ITEM}* at *{alert.LOCATION}*\n"
+                    f"• Status: `{alert.STOCK_STATUS}`\n"
+                    f"• Stock Level: `{alert.CURRENT_STOCK:.0f} units`\n"
+                    f"• Est. Stockout: `{alert.DAYS_UNTIL_STOCKOUT:.1f} days`"
+        }
+    }
+
 if __name__ == "__main__":
     # Test script
-    test_data = pd.DataFrame([{
-        'LOCATION': 'Chennai',
-        'ITEM': 'ORS',
-        'STOCK_STATUS': 'CRITICAL',
-        'CURRENT_STOCK': 50,
-        'DAYS_UNTIL_STOCKOUT': 1.5,
-        'ALERT_MESSAGE': 'Critical stock at Chennai'
-    }])
+    test_data = pd.DataFrame.from_records(
+        [('Chennai', 'ORS', 'CRITICAL', 50, 1.5, 'Critical stock at Chennai')],
+        columns=SLACK_ALERT_COLUMNS + ['ALERT_MESSAGE']
+    ).astype({'CURRENT_STOCK': 'int32', 'DAYS_UNTIL_STOCKOUT': 'float32'})
     notifier = SlackNotifier()
     notifier.send_alert_message(test_data)
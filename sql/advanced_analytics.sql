@@ -111,8 +111,14 @@ ORDER BY location, total_value DESC;
 -- View 3: Stockout Impact Analysis
 -- ============================================================================
 -- Calculate potential patient/beneficiary impact from stock-outs
+-- Materialized as a dynamic table so the join is not re-run on every read;
+-- consumers apply their own ORDER BY. A view left by earlier versions is
+-- dropped by init_infra.py before this script runs
 
-CREATE OR REPLACE VIEW stockout_impact AS
+CREATE OR REPLACE DYNAMIC TABLE stockout_impact
+    TARGET_LAG = '1 minute'
+    WAREHOUSE = compute_wh
+    AS
 SELECT
     h.location,
     h.item,
@@ -156,8 +162,7 @@ SELECT
     h.last_updated_date
 FROM stock_health h
 LEFT JOIN abc_analysis a ON h.item = a.item
-WHERE h.stock_status IN ('OUT_OF_STOCK', 'CRITICAL', 'WARNING')
-ORDER BY action_priority, patients_affected_until_stockout DESC;
+WHERE h.stock_status IN ('OUT_OF_STOCK', 'CRITICAL', 'WARNING');
 
 -- ============================================================================
 -- View 4: Critical Items Dashboard
@@ -355,8 +360,12 @@ FROM bulk_opportunities;
 -- View 8: Budget Tracking
 -- ============================================================================
 -- Monitor procurement spending against budget
+-- Single-row dynamic table, refreshed when reorder_recommendations changes
 
-CREATE OR REPLACE VIEW budget_tracking AS
+CREATE OR REPLACE DYNAMIC TABLE budget_tracking
+    TARGET_LAG = '1 minute'
+    WAREHOUSE = compute_wh
+    AS
 WITH monthly_procurement AS (
     SELECT
         SUM(r.reorder_quantity * p.unit_price) AS estimated_spend
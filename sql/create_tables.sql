@@ -71,6 +71,7 @@ CREATE OR REPLACE TABLE alert_log (
     location STRING NOT NULL,
     item STRING NOT NULL,
     alert_type STRING NOT NULL COMMENT 'CRITICAL, WARNING, INFO',
+    alert_severity NUMBER(1) DEFAULT 4 COMMENT '1=OUT_OF_STOCK, 2=CRITICAL, 3=WARNING, 4=other (sort key)',
     alert_message STRING,
     days_left NUMBER(5,2),
     recommended_reorder_qty NUMBER(10,2),
@@ -79,7 +80,9 @@ CREATE OR REPLACE TABLE alert_log (
     acknowledged_by STRING,
     acknowledged_at TIMESTAMP_NTZ,
     CONSTRAINT pk_alert_log PRIMARY KEY (alert_id)
-) COMMENT = 'Log of all stock alerts generated';
+)
+CLUSTER BY (alert_severity, alert_date)
+COMMENT = 'Log of all stock alerts generated';
 
 -- ============================================================================
 -- User Actions Table (Unistore)
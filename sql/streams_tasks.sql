@@ -42,8 +42,15 @@ CREATE OR REPLACE TASK generate_critical_alerts
     SCHEDULE = '5 MINUTE'
 AS
 BEGIN
-    INSERT INTO alert_log (location, item, alert_type, alert_message)
-    SELECT h."location", h."item", h.stock_status, 'Stock alert triggered'
+    INSERT INTO alert_log (location, item, alert_type, alert_severity, alert_message)
+    SELECT h."location", h."item", h.stock_status,
+        CASE h.stock_status
+            WHEN 'OUT_OF_STOCK' THEN 1
+            WHEN 'CRITICAL' THEN 2
+            WHEN 'WARNING' THEN 3
+            ELSE 4
+        END,
+        'Stock alert triggered'
     FROM stock_health h
     WHERE h.stock_status IN ('OUT_OF_STOCK', 'CRITICAL', 'WARNING');
 END;
@@ -34,7 +34,6 @@ def send_notifications(filtered_data):
                         session = get_snowflake_session()
                         sender = AlertSender(session)
                         sender.send_alerts(filtered_data)
-                        session.close()
                         st.success(f"Notifications for {len(filtered_data)} items delivered!")
                     except Exception as e:
                         st.error(f"Failed to send notifications: {e}")
@@ -5,8 +5,19 @@ Allows users to upload CSV stock data directly to the database.
 
 import streamlit as st
 import pandas as pd
+import sys
+import os
 from datetime import datetime
 
+# Add python folder to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'python'))
+
+try:
+    from config import copy_via_parquet
+except ImportError:
+    # Running inside Snowflake without the python/ helpers
+    copy_via_parquet = None
+
 def render_data_management_page():
     """Render Data Management page."""
     
@@ -65,20 +76,26 @@ def render_data_management_page():
                     return
                 
                 with st.spinner("Uploading data..."):
-                    # Ensure date column is formatted correctly
+                    # Ensure date column is formatted correctly. A fixed ISO format skips
+                    # per-value format inference, and cache=True parses each distinct
+                    # date once since a stock upload repeats the same few days
                     if 'LAST_UPDATED_DATE' in df.columns:
-                        df['LAST_UPDATED_DATE'] = pd.to_datetime(df['LAST_UPDATED_DATE']).dt.date
+                        df['LAST_UPDATED_DATE'] = pd.to_datetime(
+                            df['LAST_UPDATED_DATE'], format='ISO8601', cache=True
+                        ).dt.date
                     
                     # Fix SQL Error: Table has 7 columns (including CREATED_AT), but CSV has 6.
                     # Explicitly add CREATED_AT to match the schema.
                     df['CREATED_AT'] = datetime.now()
                     
-                    # Write to Snowflake
-                    # Using write_pandas is standard, but sometimes requires extra setup.
-                    # Since we have an active session, we can try creating a dataframe and writing it.
+                    # Write to Snowflake: one staged Parquet file and a single COPY INTO,
+                    # or a Snowpark dataframe append when the helper is unavailable
                     try:
-                        snowpark_df = session.create_dataframe(df)
-                        snowpark_df.write.mode("append").save_as_table("RAW_STOCK")
+                        if copy_via_parquet is not None:
+                            copy_via_parquet(session, df, "RAW_STOCK")
+                        else:
+                            snowpark_df = session.create_dataframe(df)
+                            snowpark_df.write.mode("append").save_as_table("RAW_STOCK")
                         st.success(f"Successfully uploaded {len(df)} records to RAW_STOCK.")
                     except Exception as e:
                         st.error(f"Upload failed: {str(e)}")
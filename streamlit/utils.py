@@ -300,7 +300,9 @@ def load_stockout_impact():
     session = get_session()
     if session:
         try:
-            df = session.sql('SELECT * FROM stockout_impact').to_pandas()
+            df = session.sql(
+                'SELECT * FROM stockout_impact ORDER BY action_priority, patients_affected_until_stockout DESC'
+            ).to_pandas()
             df.columns = [c.upper() for c in df.columns]
             return df
         except Exception as e: